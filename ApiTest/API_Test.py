@@ -1,31 +1,134 @@
-import os
-from openai import OpenAI
-from dotenv import load_dotenv
-
-load_dotenv()
-client = OpenAI(
-    base_url="https://models.github.ai/inference",
-    api_key=os.getenv("GITHUB_API_KEY")
-)
-def chat_gpt(prompet):
-
-        response = client.chat.completions.create(
-        messages=[
-            {"role": "system", "content": ""},
-            {"role": "user", "content": prompet}
-        ],
-        model="openai/gpt-4.1-mini",
+import logging
+
+from .rag_prompt_builder import build_rag_messages, make_chroma_retriever
+from .llm_gateway import LLMGateway
+from .session_store import SessionStore
+
+# Modèles acceptables par ordre de préférence (la passerelle choisit le fournisseur)
+CHAT_MODELS = ["openai/gpt-4.1-mini", "openai/gpt-oss-120b"]
+
+logger = logging.getLogger(__name__)
+
+_gateway = None
+
+def get_gateway():
+        """Charge le .env et construit la passerelle à la première utilisation"""
+        global _gateway
+        if _gateway is None:
+                from dotenv import load_dotenv
+                load_dotenv()
+                _gateway = LLMGateway()
+        return _gateway
+
+def summarize(prompt):
+        return get_gateway().chat(
+        messages=[{"role": "user", "content": prompt}],
+        models=CHAT_MODELS,
+        temperature=0.3,
+        max_tokens=300
+        )["content"]
+
+sessions = SessionStore(summarize_fn=summarize)
+
+_retriever = None
+
+def get_retriever():
+        """Retriever sur la collection des paires FAQ (python -m GnerateData ingest --faq), None si indisponible"""
+        global _retriever
+        if _retriever is None:
+                try:
+                        import chromadb
+                        from VectorStore.ingest_documents import CHROMA_PATH, FAQ_CHROMA_COLLECTION, load_encoder
+                        collection = chromadb.PersistentClient(path=CHROMA_PATH).get_collection(FAQ_CHROMA_COLLECTION)
+                        encoder = load_encoder()
+                        _retriever = make_chroma_retriever(collection, lambda text: encoder.encode(text))
+                except Exception as e:
+                        logger.warning(f"Base FAQ indisponible, réponses sans passages récupérés: {e}")
+                        _retriever = False
+        return _retriever or None
+
+_profiles = None
+
+def get_customer_context(customer_id):
+        """Profil de fidélité précalculé du client (CustomerData/customer_profiles.py)"""
+        global _profiles
+        if _profiles is None:
+                from CustomerData.customer_profiles import ProfileStore
+                _profiles = ProfileStore()
+        from CustomerData.customer_profiles import format_profile_context
+        return format_profile_context(_profiles.get(customer_id))
+
+_faq_service = None
+
+def get_faq_service():
+        """Index des paires FAQ générées, construit à la première utilisation (ApiTest/faq_service.py)"""
+        global _faq_service
+        if _faq_service is None:
+                from .faq_service import FAQIndex, FAQService, load_faq_records
+                records = load_faq_records()
+                if not records:
+                        logger.warning("Aucune paire FAQ chargée, toutes les questions passent par le LLM")
+                _faq_service = FAQService(FAQIndex(records), answer_fn=llm_answer)
+        return _faq_service
+
+def with_faq_passage(retriever, match, score):
+        """Ajoute la paire FAQ trouvée en tête des passages (même texte que l'ingestion --faq, donc dédoublonnée)"""
+        passage = {
+        "id": f"faq-{match['id']}",
+        "text": f"Question: {match['question']}\nRéponse: {match['answer']}",
+        "score": score,
+        "metadata": {"category": match["category"]},
+        }
+        def combined(question, k):
+                return [passage] + (retriever(question, k) if retriever else [])
+        return combined
+
+def llm_answer(prompet, retriever=None, history=None, customer_context="", match=None, score=None):
+        """Repli LLM: prompt RAG avec historique de session, profil client et paire FAQ trouvée"""
+        retriever = retriever or get_retriever()
+        if match is not None:
+                retriever = with_faq_passage(retriever, match, score)
+        response = get_gateway().chat(
+        messages=build_rag_messages(prompet, retriever, CHAT_MODELS[0], history=history or [],
+                                    customer_context=customer_context),
+        models=CHAT_MODELS,
         temperature=1,
         max_tokens=4096,
         top_p=1
         )
-        return response.choices[0].message.content
+        prompt_tokens = getattr(response["usage"], "prompt_tokens", None)
+        logger.info(f"Tokens d'entrée facturés: {prompt_tokens} ({response['provider']}/{response['model']})")
+        return response["content"]
 
-# print(response.choices[0].message.content)
-if __name__ == "__main__":
+def chat_gpt(prompet, retriever=None, session_id=None, customer_id=None):
+
+        history = sessions.get_history(session_id) if session_id else []
+        customer_context = get_customer_context(customer_id) if customer_id else ""
+        # Sans contexte: réponse FAQ directe (ou en cache), sinon repli LLM.
+        # Avec historique ou profil client: réponse LLM personnalisée, paire FAQ trouvée en passage.
+        answer_fn = None
+        if retriever is not None or history or customer_context:
+                answer_fn = lambda question, match, score: llm_answer(
+                        question, retriever, history, customer_context, match, score)
+        result = get_faq_service().answer(prompet, answer_fn=answer_fn)
+        if result["used_llm"]:
+                source = "LLM personnalisé" if answer_fn else ("cache LLM" if result["from_cache"] else "LLM")
+        else:
+                source = "cache FAQ" if result["from_cache"] else "FAQ"
+        logger.info(f"Réponse {source} (similarité {result['score']:.2f}, {1000 * result['latency']:.0f} ms)")
+        if session_id:
+                sessions.append_turn(session_id, prompet, result["answer"])
+        return result["answer"]
+
+def main():
+        logging.basicConfig(level=logging.INFO)
         while True :
                 input_user = input('you: ')
                 if  input_user.lower() in ['quit','bay','exist']:
                         break
-                resp =chat_gpt(input_user)
-                print('chatbot :',resp)
\ No newline at end of file
+                resp =chat_gpt(input_user, session_id="console")
+                print('chatbot :',resp)
+
+# print(response.choices[0].message.content)
+if __name__ == "__main__":
+        main()
@@ -1,41 +1,52 @@
-from groq import Groq
 import os
 import datetime
-from dotenv import load_dotenv
 
-load_dotenv()
+_client = None
 
-client = Groq(
-    api_key=os.getenv("GROQ_API_KEY"),
-)
+def get_client():
+    """Construit le client Groq à la première utilisation"""
+    global _client
+    if _client is None:
+        from dotenv import load_dotenv
+        from groq import Groq
+        load_dotenv()
+        _client = Groq(
+            api_key=os.getenv("GROQ_API_KEY"),
+        )
+    return _client
 
-with open('resume.txt', 'r') as resume_file:
-    resume = resume_file.read()
+def build_custom_resume(resume, jobDescription):
+    completion = get_client().chat.completions.create(
+        model="openai/gpt-oss-120b",
+        messages=[
+            {
+                "role": "user",
+                "content": "Build a custom resume for this job posting here is the resume:" + resume + "  and here is the job description " + jobDescription
+            },
+            {
+                "role": "assistant",
+                "content": "Please provide the job posting details, and I'll create a custom resume tailored to the job requirements.\n\nPlease provide the following information:\n\n1. Job title\n2. Job description\n3. Requirements (e.g., skills, experience, education)\n4. Any specific keywords or phrases mentioned in the job posting\n\nOnce I have this information, I'll create a custom resume that highlights your relevant skills and experiences, increasing your chances of getting noticed by the hiring manager."
+            }
+        ],
+        temperature=1,
+        max_tokens=1024,
+        top_p=1,
+        stream=False,
+        stop=None,
+    )
+    return completion.choices[0].message.content
 
-with open('jobDescription.txt', 'r') as job_description_file:
-    jobDescription = job_description_file.read()
+def main():
+    with open('resume.txt', 'r') as resume_file:
+        resume = resume_file.read()
 
-completion = client.chat.completions.create(
-    model="openai/gpt-oss-120b",
-    messages=[
-        {
-            "role": "user",
-            "content": "Build a custom resume for this job posting here is the resume:" + resume + "  and here is the job description " + jobDescription
-        },
-        {
-            "role": "assistant",
-            "content": "Please provide the job posting details, and I'll create a custom resume tailored to the job requirements.\n\nPlease provide the following information:\n\n1. Job title\n2. Job description\n3. Requirements (e.g., skills, experience, education)\n4. Any specific keywords or phrases mentioned in the job posting\n\nOnce I have this information, I'll create a custom resume that highlights your relevant skills and experiences, increasing your chances of getting noticed by the hiring manager."
-        }
-    ],
-    temperature=1,
-    max_tokens=1024,
-    top_p=1,
-    stream=False,
-    stop=None,
-)
+    with open('jobDescription.txt', 'r') as job_description_file:
+        jobDescription = job_description_file.read()
 
+    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    output_file_name = f"resume_{timestamp}.md"    
+    with open(output_file_name, 'w') as output_file:
+        output_file.write(build_custom_resume(resume, jobDescription))
 
-timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-output_file_name = f"resume_{timestamp}.md"    
-with open(output_file_name, 'w') as output_file:
-    output_file.write(completion.choices[0].message.content)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+"""
+Chemin de chat du chatbot FAQ (passerelle LLM, prompts RAG, sessions).
+
+Boucle de chat en console: python -m GnerateData chat
+"""
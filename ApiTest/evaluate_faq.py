@@ -0,0 +1,208 @@
+import os
+import sys
+import json
+import random
+import logging
+import argparse
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .faq_service import (FAQIndex, FAQService, HashingEncoder, sentence_transformer_encoder,
+                          load_faq_records, DATASET_DIR, TOP_K)
+
+"""
+Évaluation hors ligne du chemin de réponse FAQ de chat_gpt (qualité et latence):
+- Charge les paires générées loyalty_card_*.jsonl et en réserve une partie par catégorie
+- Indexe seulement les paires restantes, puis paraphrase les questions réservées (règles ou LLM)
+- Rejoue les paraphrases dans FAQService (cache, recherche, repli llm_answer) sur un pool de processus
+- Rapport par catégorie: catégorie@1 et @k, taux et justesse des réponses FAQ directes,
+  percentiles de latence, taux de repli LLM et de cache
+
+Les questions réservées sont absentes de l'index: la mesure est la capacité à répondre
+avec une paire de la bonne catégorie à une question que la FAQ ne contient pas.
+"""
+
+logger = logging.getLogger(__name__)
+
+# ----------------- PARAMÈTRES -----------------
+
+HOLDOUT_FRACTION = 0.2      # Part des paires de chaque catégorie retirées de l'index
+REPEAT_QUERIES = 2          # Chaque requête est rejouée N fois dans le même lot (effet du cache)
+WORKERS = os.cpu_count() or 2
+SEED = 42
+ENCODER_MODEL_ID = None     # Ex: "sentence-transformers/distiluse-base-multilingual-cased-v2"
+
+FILLERS = ["svp", "s'il vous plaît", "bonjour", "merci", "au fait"]
+PARAPHRASE_PROMPT = """Reformule cette question de client sur la carte de fidélité avec d'autres mots,
+sans changer son sens. Réponds seulement avec la question reformulée.
+
+QUESTION: {question}"""
+
+# ----------------- DONNÉES -----------------
+
+def split_holdout(records, fraction=HOLDOUT_FRACTION, seed=SEED):
+    """Sépare (paires indexées, paires réservées) par catégorie, reproductible
+
+    Une catégorie d'une seule paire reste entièrement indexée.
+    """
+    rng = random.Random(seed)
+    by_category = defaultdict(list)
+    for record in records:
+        by_category[record["category"]].append(record)
+    indexed, holdout = [], []
+    for category_records in by_category.values():
+        size = max(1, int(len(category_records) * fraction)) if len(category_records) > 1 else 0
+        held_ids = {record["id"] for record in rng.sample(category_records, size)}
+        for record in category_records:
+            (holdout if record["id"] in held_ids else indexed).append(record)
+    return indexed, holdout
+
+# ----------------- PARAPHRASES -----------------
+
+def rule_paraphrase(question, rng):
+    """Paraphrase bon marché: ponctuation, casse, mot retiré, formule de politesse"""
+    words = question.rstrip(" ?").split()
+    if len(words) > 4:
+        del words[rng.randrange(1, len(words))]
+    if rng.random() < 0.5:
+        words.insert(0, rng.choice(FILLERS).capitalize() + ",")
+    text = " ".join(words)
+    return (text.lower() if rng.random() < 0.3 else text) + rng.choice([" ?", "?", ""])
+
+def llm_paraphrase(question):
+    from .API_Test import get_gateway, CHAT_MODELS
+    return get_gateway().chat(
+        messages=[{"role": "user", "content": PARAPHRASE_PROMPT.format(question=question)}],
+        models=CHAT_MODELS,
+        temperature=0.9,
+        max_tokens=200
+    )["content"].strip()
+
+def build_queries(holdout, use_llm=False, seed=SEED):
+    """Crée les requêtes uniques à rejouer, mélangées: (catégorie attendue, paraphrase)"""
+    rng = random.Random(seed)
+    queries = []
+    for record in holdout:
+        text = llm_paraphrase(record["question"]) if use_llm else rule_paraphrase(record["question"], rng)
+        queries.append((record["category"], text))
+    rng.shuffle(queries)
+    return queries
+
+# ----------------- WORKERS -----------------
+
+_service = None
+_categories = {}
+
+def _init_worker(records, encoder_model_id, llm_fallback):
+    """Construit l'index et le service une fois par processus"""
+    global _service, _categories
+    _categories = {record["id"]: record["category"] for record in records}
+    encode_fn = sentence_transformer_encoder(encoder_model_id) if encoder_model_id else HashingEncoder()
+    answer_fn = None
+    if llm_fallback:
+        from .API_Test import llm_answer
+        answer_fn = llm_answer
+    _service = FAQService(FAQIndex(records, encode_fn), answer_fn=answer_fn)
+
+def _run_queries(batch):
+    """Rejoue un lot de requêtes uniques `repeat` fois: les répétitions partagent le cache du processus"""
+    queries, repeat = batch
+    results = []
+    for category, text in queries * repeat:
+        response = _service.answer(text, k=TOP_K)
+        retrieved_categories = [_categories[record_id] for record_id in response["retrieved_ids"]]
+        results.append({
+            "category": category,
+            "category_at_1": response["category"] == category,
+            "category_at_k": category in retrieved_categories,
+            "faq_answer": response["matched"],
+            "faq_correct": response["matched"] and response["category"] == category,
+            "latency": response["latency"],
+            "used_llm": response["used_llm"],
+            "from_cache": response["from_cache"],
+        })
+    return results
+
+# ----------------- RAPPORT -----------------
+
+def summarize(results):
+    """Agrège les résultats par catégorie et au total"""
+    groups = defaultdict(list)
+    for result in results:
+        groups[result["category"]].append(result)
+        groups["TOTAL"].append(result)
+
+    report = {}
+    for category, rows in sorted(groups.items()):
+        latencies_ms = np.array([row["latency"] for row in rows]) * 1000
+        faq_rows = [row for row in rows if row["faq_answer"]]
+        report[category] = {
+            "queries": len(rows),
+            "category@1": float(np.mean([row["category_at_1"] for row in rows])),
+            f"category@{TOP_K}": float(np.mean([row["category_at_k"] for row in rows])),
+            "faq_answer_rate": len(faq_rows) / len(rows),
+            # Part des réponses FAQ directes dans la bonne catégorie (None sans réponse directe)
+            "faq_precision": float(np.mean([row["faq_correct"] for row in faq_rows])) if faq_rows else None,
+            "p50_ms": float(np.percentile(latencies_ms, 50)),
+            "p95_ms": float(np.percentile(latencies_ms, 95)),
+            "p99_ms": float(np.percentile(latencies_ms, 99)),
+            "llm_fallback_rate": float(np.mean([row["used_llm"] for row in rows])),
+            "cache_hit_rate": float(np.mean([row["from_cache"] for row in rows])),
+        }
+    return report
+
+def print_report(report):
+    print("Mesure: paraphrase d'une question réservée (absente de l'index) -> catégorie de la réponse")
+    print(f"{'catégorie':22} {'n':>5} {'cat@1':>6} {'cat@k':>6} {'FAQ%':>6} {'FAQok':>6} {'p50ms':>7} {'p95ms':>7} {'p99ms':>7} {'LLM%':>6} {'cache%':>6}")
+    for category, stats in report.items():
+        precision = "-" if stats["faq_precision"] is None else f"{stats['faq_precision']:.2f}"
+        print(
+            f"{category:22} {stats['queries']:5d} {stats['category@1']:6.2f} {stats[f'category@{TOP_K}']:6.2f} "
+            f"{100 * stats['faq_answer_rate']:6.1f} {precision:>6} {stats['p50_ms']:7.2f} {stats['p95_ms']:7.2f} "
+            f"{stats['p99_ms']:7.2f} {100 * stats['llm_fallback_rate']:6.1f} {100 * stats['cache_hit_rate']:6.1f}"
+        )
+
+def evaluate(dataset_dir=DATASET_DIR, workers=WORKERS, llm_paraphrases=False, llm_fallback=False,
+             encoder_model_id=ENCODER_MODEL_ID, repeat=REPEAT_QUERIES):
+    """Lance l'évaluation complète et retourne le rapport"""
+    records = load_faq_records(dataset_dir)
+    if not records:
+        raise ValueError(f"Aucune paire loyalty_card_*.jsonl trouvée dans {dataset_dir}")
+    indexed, holdout = split_holdout(records)
+    queries = build_queries(holdout, use_llm=llm_paraphrases)
+    logger.info(f"🧪 {len(queries)} requêtes x{repeat} sur {len(indexed)} paires indexées "
+                f"({len(holdout)} réservées) avec {workers} processus")
+
+    # Chaque processus garde son propre cache: un lot contient toutes les répétitions de ses requêtes
+    batch_size = max(1, len(queries) // (workers * 4))
+    batches = [(queries[i:i + batch_size], repeat) for i in range(0, len(queries), batch_size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(indexed, encoder_model_id, llm_fallback)) as executor:
+        results = [row for batch_results in executor.map(_run_queries, batches) for row in batch_results]
+    return summarize(results)
+
+def main(argv=None):
+    """Fonction principale"""
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Évaluation hors ligne du chatbot FAQ")
+    parser.add_argument("--dataset-dir", default=DATASET_DIR)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--repeat", type=int, default=REPEAT_QUERIES)
+    parser.add_argument("--encoder", default=ENCODER_MODEL_ID, help="Modèle SentenceTransformer (sinon encodeur par hachage)")
+    parser.add_argument("--llm-paraphrases", action="store_true", help="Paraphraser avec le LLM au lieu des règles")
+    parser.add_argument("--llm-fallback", action="store_true", help="Appeler réellement le LLM en repli")
+    parser.add_argument("--output", help="Fichier JSON du rapport")
+    args = parser.parse_args(argv)
+
+    report = evaluate(args.dataset_dir, args.workers, args.llm_paraphrases, args.llm_fallback,
+                      args.encoder, args.repeat)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+    return report
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,191 @@
+import os
+import re
+import glob
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+"""
+Chemin de réponse FAQ complet du chatbot (utilisé par chat_gpt dans API_Test.py):
+- Cache LRU par question normalisée (recherche et réponse générique)
+- Recherche de la question FAQ la plus proche (similarité cosinus)
+- Réponse FAQ directe si la similarité dépasse le seuil, sinon repli sur le LLM;
+  avec un contexte (historique, profil client), le LLM répond avec la paire FAQ trouvée
+"""
+
+logger = logging.getLogger(__name__)
+
+# ----------------- PARAMÈTRES -----------------
+
+DATASET_DIR = "loyalty_card_datasets"
+ANSWER_THRESHOLD = 0.75     # Similarité min pour répondre directement avec la FAQ
+CACHE_SIZE = 10_000
+HASHING_DIM = 2 ** 12       # Dimension de l'encodeur par hachage (sans modèle)
+TOP_K = 5
+
+# ----------------- DONNÉES -----------------
+
+def load_faq_records(dataset_dir=DATASET_DIR):
+    """Charge les paires Q&A par catégorie (exclut le dataset complet et le format d'entraînement)"""
+    records = []
+    for file_path in sorted(glob.glob(os.path.join(dataset_dir, "loyalty_card_*.jsonl"))):
+        name = os.path.basename(file_path)
+        if "complete_dataset" in name or "training_format" in name:
+            continue
+        with open(file_path, "r", encoding="utf-8") as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                conv = json.loads(line)
+                records.append({
+                    "id": len(records),
+                    "question": conv["question"],
+                    "answer": conv["answer"],
+                    "category": conv.get("intent") or conv["metadata"]["category"],
+                })
+    return records
+
+# ----------------- ENCODEURS -----------------
+
+def normalize_question(text):
+    """Minuscules, ponctuation retirée, espaces compactés"""
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+class HashingEncoder:
+    """Sac de mots et bigrammes haché, normalisé L2 (aucun modèle à charger)"""
+
+    def __init__(self, dim=HASHING_DIM):
+        self.dim = dim
+
+    def _indices(self, text):
+        words = normalize_question(text).split()
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        return [
+            int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=4).digest(), "little") % self.dim
+            for feature in features
+        ]
+
+    def __call__(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for index in self._indices(text):
+                vectors[row, index] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+def sentence_transformer_encoder(model_id, device="cpu"):
+    """Encodeur SentenceTransformer (mêmes modèles que VectorStore/ingest_documents.py)"""
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_id, device=device)
+    return lambda texts: model.encode(texts, normalize_embeddings=True, show_progress_bar=False)
+
+# ----------------- INDEX -----------------
+
+class FAQIndex:
+    """Index en mémoire des questions FAQ (produit scalaire sur vecteurs normalisés)"""
+
+    def __init__(self, records, encode_fn=None):
+        self.records = records
+        self.encode_fn = encode_fn or HashingEncoder()
+        self.vectors = np.asarray(self.encode_fn([record["question"] for record in records]), dtype=np.float32)
+
+    def search(self, question, k=TOP_K):
+        """Retourne [(score, record)] des k questions les plus proches"""
+        if not self.records:
+            return []
+        query = np.asarray(self.encode_fn([question]), dtype=np.float32)[0]
+        scores = self.vectors @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.records[i]) for i in top]
+
+# ----------------- SERVICE -----------------
+
+class FAQService:
+    """Cache -> recherche FAQ -> repli LLM"""
+
+    def __init__(self, index, answer_fn=None, threshold=ANSWER_THRESHOLD, cache_size=CACHE_SIZE):
+        self.index = index
+        self.answer_fn = answer_fn
+        self.threshold = threshold
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _cache_get(self, key):
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+        return None
+
+    def _cache_put(self, key, value):
+        with self.lock:
+            self.cache[key] = value
+            self.cache.move_to_end(key)
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def lookup(self, question, k=TOP_K):
+        """Recherche FAQ mise en cache: retourne (entrée, lue depuis le cache)
+
+        L'entrée garde la paire trouvée (`match`, None sous le seuil) et la réponse
+        générique (FAQ directe, ou repli LLM une fois calculé).
+        """
+        key = normalize_question(question)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached, True
+
+        hits = self.index.search(question, k)
+        best_score, best = hits[0] if hits else (0.0, None)
+        match = best if best is not None and best_score >= self.threshold else None
+        entry = {
+            "score": best_score,
+            "category": best["category"] if best else None,
+            "retrieved_ids": [record["id"] for _, record in hits],
+            "match": match,
+            "answer": match["answer"] if match else None,
+        }
+        self._cache_put(key, entry)
+        return entry, False
+
+    def answer(self, question, k=TOP_K, answer_fn=None):
+        """Répond à une question et retourne la réponse avec ses informations de service
+
+        Sans `answer_fn`: réponse FAQ directe, sinon repli LLM générique (mis en cache).
+        Avec `answer_fn(question, match, score)` (historique de session ou profil client):
+        la recherche passe par le cache, mais la réponse est toujours générée, avec la
+        paire FAQ trouvée (ou None) en contexte.
+        """
+        start = time.perf_counter()
+        entry, from_cache = self.lookup(question, k)
+        match = entry["match"]
+        if answer_fn is not None:
+            answer = answer_fn(question, match, entry["score"])
+        elif entry["answer"] is not None:
+            answer = entry["answer"]
+        elif self.answer_fn is not None:
+            answer = self.answer_fn(question)
+            from_cache = False
+            with self.lock:
+                entry["answer"] = answer
+        else:
+            answer = None
+
+        result = {
+            "answer": answer,
+            "score": entry["score"],
+            "category": entry["category"],
+            "retrieved_ids": entry["retrieved_ids"],
+            "matched": match is not None,
+            "used_llm": answer_fn is not None or match is None,
+        }
+        return dict(result, from_cache=from_cache, latency=time.perf_counter() - start)
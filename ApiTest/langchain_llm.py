@@ -1,5 +1,9 @@
-from langchain_ollama import OllamaLLM
-model = OllamaLLM(model = 'llama3')
+def main():
+    from langchain_ollama import OllamaLLM
+    model = OllamaLLM(model = 'llama3')
 
-result = model.invoke(input = 'Hello wprld')
-print(result)
\ No newline at end of file
+    result = model.invoke(input = 'Hello wprld')
+    print(result)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+"""
+Passerelle LLM multi-fournisseurs:
+- Une seule interface `chat(messages, models, ...)` pour Groq, GitHub Models et Ollama
+- Suivi de la latence et du taux d'erreur de chaque fournisseur
+- Routage vers le fournisseur sain le plus rapide qui sert le modèle demandé
+- Requête dupliquée (hedging) vers un autre fournisseur du même modèle si la réponse dépasse le p95;
+  l'usage de la requête perdante (facturée) est remonté via `on_extra_usage`
+"""
+
+logger = logging.getLogger(__name__)
+
+# ----------------- PARAMÈTRES -----------------
+
+# Fournisseurs disponibles et modèles servis par chacun
+PROVIDERS = {
+    "groq": {
+        "kind": "groq",
+        "api_key_env": "GROQ_API_KEY",
+        "models": [
+            "openai/gpt-oss-20b",
+            "openai/gpt-oss-120b",
+            "llama-3.1-8b-instant",
+            "qwen/qwen3-32b",
+            "moonshotai/kimi-k2-instruct",
+            "gemma2-9b-it",
+        ],
+    },
+    "github": {
+        "kind": "openai",
+        "base_url": "https://models.github.ai/inference",
+        "api_key_env": "GITHUB_API_KEY",
+        "models": ["openai/gpt-4.1-mini", "openai/gpt-4.1"],
+    },
+    "ollama": {
+        "kind": "openai",
+        "base_url": "http://localhost:11434/v1",
+        "api_key_env": None,
+        "models": ["llama3"],
+    },
+}
+
+LATENCY_WINDOW = 50            # Nombre d'appels gardés pour les statistiques
+MIN_SAMPLES_FOR_P95 = 10       # En dessous, on utilise DEFAULT_HEDGE_DELAY
+DEFAULT_HEDGE_DELAY = 5.0      # Délai (s) avant requête dupliquée sans historique
+MAX_ERROR_RATE = 0.5           # Au-delà, le fournisseur est considéré en panne
+UNHEALTHY_COOLDOWN = 30.0      # Délai (s) avant de réessayer un fournisseur en panne
+ENABLE_HEDGING = True
+
+# ----------------- STATISTIQUES -----------------
+
+class ProviderStats:
+    """Latences et erreurs récentes d'un fournisseur (fenêtre glissante)"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)  # True = succès, False = erreur
+        self.unhealthy_since = None
+        self.lock = threading.Lock()
+
+    def record_success(self, latency):
+        with self.lock:
+            self.latencies.append(latency)
+            self.outcomes.append(True)
+            self.unhealthy_since = None
+
+    def record_error(self):
+        with self.lock:
+            self.outcomes.append(False)
+            if self.error_rate() > MAX_ERROR_RATE and len(self.outcomes) >= 3:
+                self.unhealthy_since = time.monotonic()
+
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def is_healthy(self):
+        if self.unhealthy_since is None:
+            return True
+        # Après le délai de refroidissement on laisse passer une requête de test
+        return time.monotonic() - self.unhealthy_since > UNHEALTHY_COOLDOWN
+
+    def median_latency(self):
+        if not self.latencies:
+            return 0.0  # Fournisseur jamais utilisé: on l'essaie en priorité
+        ordered = sorted(self.latencies)
+        return ordered[len(ordered) // 2]
+
+    def p95_latency(self):
+        if len(self.latencies) < MIN_SAMPLES_FOR_P95:
+            return DEFAULT_HEDGE_DELAY
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+# ----------------- PASSERELLE -----------------
+
+class LLMGateway:
+    """Point d'entrée unique vers tous les fournisseurs LLM"""
+
+    def __init__(self, providers=None, enable_hedging=ENABLE_HEDGING):
+        self.providers = providers or PROVIDERS
+        self.enable_hedging = enable_hedging
+        self.stats = {name: ProviderStats() for name in self.providers}
+        self._clients = {}
+        self._clients_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=8)
+
+    def _get_client(self, name):
+        """Construit le client d'un fournisseur à la première utilisation"""
+        with self._clients_lock:
+            if name not in self._clients:
+                config = self.providers[name]
+                api_key = os.getenv(config["api_key_env"]) if config.get("api_key_env") else "local"
+                if config["kind"] == "groq":
+                    from groq import Groq
+                    self._clients[name] = Groq(api_key=api_key)
+                else:
+                    from openai import OpenAI
+                    self._clients[name] = OpenAI(base_url=config["base_url"], api_key=api_key)
+            return self._clients[name]
+
+    def candidates(self, models):
+        """Liste les couples (fournisseur, modèle) possibles
+
+        Ordre: modèle par ordre de préférence, puis fournisseur du plus rapide au
+        plus lent. Les modèles suivants ne servent qu'en bascule ou en duplication.
+        """
+        if isinstance(models, str):
+            models = [models]
+        candidates = []
+        for preference, model in enumerate(models):
+            for name, config in self.providers.items():
+                if model in config["models"] and self.stats[name].is_healthy():
+                    candidates.append((preference, self.stats[name].median_latency(), name, model))
+        candidates.sort()
+        return [(name, model) for _, _, name, model in candidates]
+
+    def _call(self, name, model, messages, params):
+        """Appelle un fournisseur et enregistre sa latence ou son erreur"""
+        start = time.perf_counter()
+        try:
+            completion = self._get_client(name).chat.completions.create(
+                messages=messages,
+                model=model,
+                **params
+            )
+        except Exception:
+            self.stats[name].record_error()
+            raise
+        latency = time.perf_counter() - start
+        self.stats[name].record_success(latency)
+        return {
+            "content": completion.choices[0].message.content,
+            "choices": [choice.message.content for choice in completion.choices],
+            "usage": getattr(completion, "usage", None),
+            "provider": name,
+            "model": model,
+            "latency": latency,
+        }
+
+    def chat(self, messages, models, on_extra_usage=None, hedge_slots=None, **params):
+        """Envoie une requête chat au meilleur fournisseur disponible
+
+        `models` est un nom de modèle ou une liste de modèles acceptables par
+        ordre de préférence. Si le premier fournisseur dépasse son p95, une
+        requête dupliquée part vers le suivant s'il sert le même modèle, et la
+        première réponse gagne. En cas d'erreur, on bascule sur le candidat
+        suivant (éventuellement un autre modèle: voir result["model"]).
+
+        `hedge_slots` (sémaphore de l'appelant) borne les requêtes en vol: la
+        requête dupliquée n'est envoyée que si un emplacement est libre.
+
+        `on_extra_usage(result)` est appelé pour chaque appel réussi dont la
+        réponse n'est pas retournée (requête dupliquée perdante), avec le même
+        dictionnaire que la réponse; il peut l'être après le retour de chat(),
+        depuis un thread de la passerelle.
+        """
+        candidates = self.candidates(models)
+        if not candidates:
+            raise RuntimeError(f"Aucun fournisseur disponible pour {models}")
+
+        last_error = None
+        remaining = list(candidates)
+        submitted = []
+        while remaining:
+            name, model = remaining.pop(0)
+            futures = {self._executor.submit(self._call, name, model, messages, params)}
+            submitted.extend(futures)
+
+            hedge_delay = self.stats[name].p95_latency()
+            done, _ = wait(futures, timeout=hedge_delay if self.enable_hedging else None)
+            # Même modèle uniquement: la réponse la plus rapide ne doit pas changer de modèle
+            if not done and remaining and remaining[0][1] == model and self._take_slot(hedge_slots):
+                hedge_name, hedge_model = remaining.pop(0)
+                logger.info(f"⏱️ {name} dépasse {hedge_delay:.2f}s, requête dupliquée vers {hedge_name}")
+                hedge = self._executor.submit(self._call, hedge_name, hedge_model, messages, params)
+                if hedge_slots is not None:
+                    hedge.add_done_callback(lambda _: hedge_slots.release())
+                futures.add(hedge)
+                submitted.append(hedge)
+
+            while futures:
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        last_error = e
+                        logger.warning(f"Échec d'un fournisseur LLM: {e}")
+                        continue
+                    self._report_extra_usage(submitted, future, on_extra_usage)
+                    return result
+
+        raise RuntimeError(f"Tous les fournisseurs ont échoué pour {models}") from last_error
+
+    @staticmethod
+    def _take_slot(hedge_slots):
+        return hedge_slots is None or hedge_slots.acquire(blocking=False)
+
+    @staticmethod
+    def _report_extra_usage(submitted, winner, on_extra_usage):
+        """Remonte l'usage des autres appels réussis, terminés ou encore en vol"""
+        def report(future):
+            if future.cancelled() or future.exception() is not None:
+                return
+            result = future.result()
+            logger.debug(f"Requête perdante facturée: {result['provider']}/{result['model']}")
+            if on_extra_usage:
+                try:
+                    on_extra_usage(result)
+                except Exception as e:
+                    logger.warning(f"Échec de l'enregistrement de l'usage d'une requête perdante: {e}")
+
+        for future in submitted:
+            if future is not winner:
+                future.add_done_callback(report)
+
+    def report(self):
+        """Résumé des statistiques par fournisseur"""
+        return {
+            name: {
+                "median_latency": stats.median_latency(),
+                "p95_latency": stats.p95_latency(),
+                "error_rate": stats.error_rate(),
+                "healthy": stats.is_healthy(),
+                "calls": len(stats.outcomes),
+            }
+            for name, stats in self.stats.items()
+        }
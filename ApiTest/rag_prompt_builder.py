@@ -0,0 +1,179 @@
+import hashlib
+import logging
+import re
+
+"""
+Construction des prompts RAG avec budget de tokens:
+- Récupère les top-k passages FAQ depuis la base vectorielle
+- Supprime les passages en double ou qui se chevauchent
+- Remplit le contexte sous un budget de tokens propre à chaque modèle
+- Place les préfixes statiques en premier, dans un ordre stable,
+  pour profiter du cache de prompt côté fournisseur
+"""
+
+logger = logging.getLogger(__name__)
+
+# ----------------- PARAMÈTRES -----------------
+
+# Budget de tokens d'entrée par modèle (prompt système + passages + question)
+MODEL_INPUT_BUDGETS = {
+    "openai/gpt-4.1-mini": 3000,
+    "openai/gpt-oss-20b": 2500,
+    "openai/gpt-oss-120b": 2500,
+    "qwen/qwen3-32b": 2500,
+    "llama-3.1-8b-instant": 2000,
+    "llama3": 2000,
+}
+DEFAULT_INPUT_BUDGET = 2000
+
+TOP_K = 8                       # Passages récupérés avant déduplication
+OVERLAP_THRESHOLD = 0.6         # Seuil de chevauchement (Jaccard sur 3-grammes de mots)
+TOKENIZER_ENCODING = "cl100k_base"
+
+SYSTEM_PROMPT = """Tu es l'assistant officiel du service client pour la carte de fidélité.
+Réponds en français, de manière professionnelle et concise, en t'appuyant uniquement sur les
+informations fournies. Si l'information n'est pas disponible, dis-le clairement."""
+
+PASSAGES_HEADER = "Extraits de la FAQ pertinents:"
+
+# ----------------- TOKENIZER -----------------
+
+_tokenizer = None
+
+def get_tokenizer():
+    """Charge le tokenizer local (tiktoken) une seule fois, ou None s'il est absent"""
+    global _tokenizer
+    if _tokenizer is None:
+        try:
+            import tiktoken
+            _tokenizer = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except ImportError:
+            logger.warning("tiktoken non installé, estimation approximative des tokens")
+            _tokenizer = False
+    return _tokenizer or None
+
+def count_tokens(text):
+    """Compte les tokens d'un texte avec le tokenizer local (≈ 4 caractères par token sinon)"""
+    tokenizer = get_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text))
+    return max(1, len(text) // 4)
+
+def get_input_budget(model):
+    """Retourne le budget de tokens d'entrée pour un modèle"""
+    return MODEL_INPUT_BUDGETS.get(model, DEFAULT_INPUT_BUDGET)
+
+# ----------------- DÉDUPLICATION -----------------
+
+def _shingles(text, size=3):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def dedupe_passages(passages, threshold=OVERLAP_THRESHOLD):
+    """Supprime les doublons exacts et les passages qui se chevauchent trop
+
+    Les passages sont supposés triés par pertinence décroissante: en cas de
+    chevauchement, le plus pertinent est conservé.
+    """
+    seen_hashes = set()
+    kept, kept_shingles = [], []
+    for passage in passages:
+        text_hash = hashlib.md5(passage["text"].lower().strip().encode()).hexdigest()
+        if text_hash in seen_hashes:
+            continue
+        shingles = _shingles(passage["text"])
+        overlaps = False
+        for other in kept_shingles:
+            union = len(shingles | other)
+            if union and len(shingles & other) / union > threshold:
+                overlaps = True
+                break
+        if overlaps:
+            continue
+        seen_hashes.add(text_hash)
+        kept.append(passage)
+        kept_shingles.append(shingles)
+    return kept
+
+# ----------------- RÉCUPÉRATION -----------------
+
+def make_chroma_retriever(collection, encode_fn):
+    """Adapte une collection Chroma en fonction `retriever(question, k) -> passages`"""
+    def retriever(question, k):
+        results = collection.query(
+            query_embeddings=[list(map(float, encode_fn(question)))],
+            n_results=k
+        )
+        return [
+            {"id": doc_id, "text": text, "score": 1 - distance, "metadata": metadata or {}}
+            for doc_id, text, distance, metadata in zip(
+                results["ids"][0],
+                results["documents"][0],
+                results["distances"][0],
+                results["metadatas"][0],
+            )
+        ]
+    return retriever
+
+# ----------------- ASSEMBLAGE -----------------
+
+def pack_passages(passages, budget):
+    """Sélectionne les passages par ordre de pertinence tant qu'ils tiennent dans le budget"""
+    packed, used = [], 0
+    for passage in passages:
+        cost = count_tokens(passage["text"]) + 2  # séparateur "- " + saut de ligne
+        if used + cost > budget:
+            continue
+        packed.append(passage)
+        used += cost
+    return packed, used
+
+def build_rag_messages(question, retriever=None, model=None, static_context="",
+                       history=None, top_k=TOP_K, customer_context=""):
+    """Construit les messages du chat avec les passages FAQ sous budget de tokens
+
+    L'ordre est fixe: prompt système + contexte statique (identiques d'un appel
+    à l'autre, donc cachables), puis l'historique éventuel, puis les passages
+    récupérés, le profil du client (`customer_context`) et enfin la question.
+    """
+    history = history or []
+    system_content = SYSTEM_PROMPT
+    if static_context:
+        system_content += "\n" + static_context.strip()
+
+    budget = get_input_budget(model)
+    fixed_tokens = (
+        count_tokens(system_content)
+        + count_tokens(question)
+        + sum(count_tokens(message["content"]) for message in history)
+        + count_tokens(PASSAGES_HEADER)
+        + (count_tokens(customer_context) if customer_context else 0)
+    )
+
+    packed, passages_tokens, retrieved_tokens = [], 0, 0
+    if retriever is not None:
+        retrieved = retriever(question, top_k)
+        retrieved_tokens = sum(count_tokens(passage["text"]) + 2 for passage in retrieved)
+        packed, passages_tokens = pack_passages(dedupe_passages(retrieved), max(0, budget - fixed_tokens))
+
+    sections = []
+    if packed:
+        passages_text = "\n".join(f"- {passage['text'].strip()}" for passage in packed)
+        sections.append(f"{PASSAGES_HEADER}\n{passages_text}")
+    if customer_context:
+        sections.append(customer_context.strip())
+    user_content = "\n\n".join(sections + [f"QUESTION: {question}"]) if sections else question
+
+    messages = [{"role": "system", "content": system_content}]
+    messages.extend(history)
+    messages.append({"role": "user", "content": user_content})
+
+    # Comparaison avec l'insertion brute des top-k passages (sans déduplication ni budget)
+    logger.info(
+        f"Prompt RAG: {fixed_tokens + passages_tokens}/{budget} tokens "
+        f"(contre {fixed_tokens + retrieved_tokens} sans déduplication ni budget), "
+        f"{len(packed)} passages retenus"
+    )
+    return messages
@@ -0,0 +1,167 @@
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+from .rag_prompt_builder import count_tokens
+
+"""
+Stockage des sessions de conversation pour le chatbot:
+- Historique compact par session (résumé + derniers tours)
+- Résumé glissant dès que l'historique dépasse un seuil de tokens
+- Éviction des sessions inactives
+- Backend en mémoire par défaut, SQLite en option
+"""
+
+logger = logging.getLogger(__name__)
+
+# ----------------- PARAMÈTRES -----------------
+
+HISTORY_TOKEN_THRESHOLD = 800   # Au-delà, les anciens tours sont résumés
+KEEP_RECENT_TURNS = 2           # Tours (question + réponse) toujours gardés tels quels
+SUMMARY_MAX_CHARS = 800         # Taille max du résumé sans modèle de résumé
+SESSION_IDLE_TIMEOUT = 1800     # Secondes d'inactivité avant éviction
+
+SUMMARY_PROMPT = """Résume cette conversation entre un client et le service client carte de fidélité
+en quelques phrases. Garde les faits utiles pour la suite (carte, magasin, problème, réponses données).
+
+Résumé précédent: {summary}
+
+Nouveaux échanges:
+{turns}
+
+RÉSUMÉ:"""
+
+# ----------------- BACKENDS -----------------
+
+class InMemorySessionBackend:
+    """Sessions gardées dans un dictionnaire du processus"""
+
+    def __init__(self):
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def load(self, session_id):
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                return "", []
+            return session["summary"], list(session["turns"])
+
+    def save(self, session_id, summary, turns):
+        with self.lock:
+            self.sessions[session_id] = {
+                "summary": summary,
+                "turns": list(turns),
+                "last_access": time.time(),
+            }
+
+    def evict_idle(self, max_idle):
+        limit = time.time() - max_idle
+        with self.lock:
+            idle = [sid for sid, session in self.sessions.items() if session["last_access"] < limit]
+            for session_id in idle:
+                del self.sessions[session_id]
+        return len(idle)
+
+class SQLiteSessionBackend:
+    """Sessions persistées dans une base SQLite (une ligne par session)"""
+
+    def __init__(self, db_path="chat_sessions.db"):
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, summary TEXT, turns TEXT, last_access REAL)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_sessions_last_access ON sessions(last_access)"
+            )
+
+    def load(self, session_id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT summary, turns FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if row is None:
+            return "", []
+        return row[0], [tuple(turn) for turn in json.loads(row[1])]
+
+    def save(self, session_id, summary, turns):
+        # Format compact: [[rôle, contenu], ...] sans espaces superflus
+        turns_json = json.dumps(turns, ensure_ascii=False, separators=(",", ":"))
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, summary, turns, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                (session_id, summary, turns_json, time.time())
+            )
+
+    def evict_idle(self, max_idle):
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "DELETE FROM sessions WHERE last_access < ?", (time.time() - max_idle,)
+            )
+        return cursor.rowcount
+
+# ----------------- STORE -----------------
+
+class SessionStore:
+    """Historique borné des conversations avec résumé glissant"""
+
+    def __init__(self, backend=None, summarize_fn=None,
+                 token_threshold=HISTORY_TOKEN_THRESHOLD, idle_timeout=SESSION_IDLE_TIMEOUT):
+        self.backend = backend or InMemorySessionBackend()
+        self.summarize_fn = summarize_fn
+        self.token_threshold = token_threshold
+        self.idle_timeout = idle_timeout
+        self._last_eviction = time.time()
+
+    def get_history(self, session_id):
+        """Retourne l'historique sous forme de messages chat (résumé puis derniers tours)"""
+        summary, turns = self.backend.load(session_id)
+        messages = []
+        if summary:
+            messages.append({"role": "system", "content": f"Résumé de la conversation: {summary}"})
+        messages.extend({"role": role, "content": content} for role, content in turns)
+        return messages
+
+    def append_turn(self, session_id, user_message, assistant_message):
+        """Ajoute un tour à la session et résume les anciens tours si nécessaire"""
+        summary, turns = self.backend.load(session_id)
+        turns.append(("user", user_message))
+        turns.append(("assistant", assistant_message))
+
+        history_tokens = count_tokens(summary) + sum(count_tokens(content) for _, content in turns)
+        keep = KEEP_RECENT_TURNS * 2
+        if history_tokens > self.token_threshold and len(turns) > keep:
+            old_turns, turns = turns[:-keep], turns[-keep:]
+            summary = self._summarize(summary, old_turns)
+
+        self.backend.save(session_id, summary, turns)
+        self._maybe_evict()
+
+    def _summarize(self, summary, turns):
+        """Fusionne les anciens tours dans le résumé de la session"""
+        if self.summarize_fn is not None:
+            turns_text = "\n".join(f"{role}: {content}" for role, content in turns)
+            prompt = SUMMARY_PROMPT.format(summary=summary or "Aucun", turns=turns_text)
+            try:
+                return self.summarize_fn(prompt).strip()
+            except Exception as e:
+                # La réponse est déjà obtenue: un échec du résumé ne doit pas perdre le tour
+                logger.warning(f"Échec du résumé LLM, résumé simple utilisé: {e}")
+        # Sans modèle de résumé, on garde seulement les questions du client
+        questions = " | ".join(content for role, content in turns if role == "user")
+        return f"{summary} | {questions}".strip(" |")[-SUMMARY_MAX_CHARS:]
+
+    def _maybe_evict(self):
+        now = time.time()
+        if now - self._last_eviction < self.idle_timeout / 10:
+            return
+        self._last_eviction = now
+        evicted = self.backend.evict_idle(self.idle_timeout)
+        if evicted:
+            logger.info(f"🧹 {evicted} sessions inactives supprimées")
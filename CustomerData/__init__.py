@@ -0,0 +1,6 @@
+"""
+Données clients (achats en magasin) pour personnaliser les réponses du chatbot.
+
+Nettoyage en streaming: python -m CustomerData.clean_customer_data
+Profils de fidélité:     python -m CustomerData.customer_profiles lot1.csv [lot2.csv ...]
+"""
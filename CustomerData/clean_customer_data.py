@@ -0,0 +1,193 @@
+import os
+import sys
+import logging
+import argparse
+
+import numpy as np
+import pandas as pd
+
+"""
+Pipeline de nettoyage des données clients (customer_shopping_data.csv):
+- Lecture par morceaux avec des types explicites (catégories pour les colonnes texte);
+  l'en-tête `cpinvoice_no` du fichier source est renommé `invoice_no`, et une colonne
+  manquante lève une erreur au lieu de désactiver silencieusement une étape
+- Statistiques globales (médiane, IQR de l'âge) calculées sur la seule colonne `age`
+- Nettoyage en une seule passe vectorisée par morceau: valeurs manquantes,
+  doublons, écrêtage des valeurs aberrantes, montant dépensé
+- Table de caractéristiques Parquet compacte indexée par `customer_id`
+"""
+
+logger = logging.getLogger(__name__)
+
+# ----------------- PARAMÈTRES -----------------
+
+INPUT_FILE = "/home/anas-nouri/chatBotAPP/datasets/loyalty_card_datasets/customer_shopping_data.csv"
+OUTPUT_FILE = "/home/anas-nouri/chatBotAPP/datasets/loyalty_card_datasets/customer_features.parquet"
+CHUNK_SIZE = 200_000
+
+CATEGORICAL_COLUMNS = ["gender", "category", "payment_method", "shopping_mall"]
+CSV_DTYPES = {
+    "invoice_no": "string",
+    "customer_id": "string",
+    "gender": "category",
+    "age": "float32",
+    "category": "category",
+    "quantity": "float32",
+    "price": "float32",
+    "payment_method": "category",
+    "shopping_mall": "category",
+}
+DATE_COLUMN = "invoice_date"
+# En-têtes réels du CSV renommés à la lecture (le fichier source écrit `cpinvoice_no`)
+COLUMN_ALIASES = {"cpinvoice_no": "invoice_no"}
+REQUIRED_COLUMNS = list(CSV_DTYPES) + [DATE_COLUMN]
+DATE_FORMAT = "%d/%m/%Y"
+UNKNOWN = "unknown"
+IQR_FACTOR = 1.5
+
+# ----------------- STATISTIQUES -----------------
+
+def compute_age_stats(csv_path, chunk_size=CHUNK_SIZE):
+    """Médiane et bornes IQR de l'âge, en ne lisant que la colonne `age`"""
+    ages = pd.concat(
+        chunk["age"].dropna()
+        for chunk in pd.read_csv(csv_path, usecols=["age"], dtype={"age": "float32"}, chunksize=chunk_size)
+    )
+    q1, median, q3 = ages.quantile([0.25, 0.5, 0.75]).tolist()
+    iqr = q3 - q1
+    return {
+        "median": float(median),
+        "lower": float(q1 - IQR_FACTOR * iqr),
+        "upper": float(q3 + IQR_FACTOR * iqr),
+    }
+
+# ----------------- NETTOYAGE -----------------
+
+def clean_chunk(chunk, age_stats, seen_invoices=None):
+    """Nettoie un morceau en une passe (remplace la chaîne fillna/dropna/drop_duplicates/IQR)"""
+    # Lignes inexploitables: sans client, quantité ou prix
+    valid = chunk["customer_id"].notna() & chunk["quantity"].notna() & chunk["price"].notna()
+
+    # Doublons exacts de facture, dans le morceau et avec les morceaux précédents
+    valid &= ~chunk["invoice_no"].duplicated()
+    if seen_invoices is not None:
+        valid &= ~chunk["invoice_no"].isin(seen_invoices)
+    chunk = chunk.loc[valid]
+    if seen_invoices is not None:
+        seen_invoices.update(chunk["invoice_no"].dropna().tolist())
+
+    # Âge: médiane globale pour les manquants, écrêtage IQR pour les aberrants (sans stats: âge brut)
+    age = chunk["age"].to_numpy(dtype=np.float32, na_value=np.nan)
+    if age_stats is not None:
+        age = np.clip(np.where(np.isnan(age), age_stats["median"], age), age_stats["lower"], age_stats["upper"])
+
+    columns = {
+        "customer_id": chunk["customer_id"],
+        "age": age.astype(np.float32),
+        "quantity": chunk["quantity"].astype("int16"),
+        "price": chunk["price"],
+        "spend": (chunk["quantity"] * chunk["price"]).astype("float32"),
+    }
+    for column in CATEGORICAL_COLUMNS:
+        values = chunk[column]
+        if UNKNOWN not in values.cat.categories:
+            values = values.cat.add_categories([UNKNOWN])
+        columns[column] = values.fillna(UNKNOWN)
+    columns[DATE_COLUMN] = pd.to_datetime(chunk[DATE_COLUMN], format=DATE_FORMAT, errors="coerce")
+    columns["invoice_no"] = chunk["invoice_no"]
+    return pd.DataFrame(columns, index=chunk.index)
+
+def resolve_columns(csv_path):
+    """Correspondance en-tête réel -> nom attendu; erreur si une colonne manque"""
+    header = pd.read_csv(csv_path, nrows=0).columns
+    renames = {column: COLUMN_ALIASES.get(column, column) for column in header}
+    missing = [column for column in REQUIRED_COLUMNS if column not in renames.values()]
+    if missing:
+        raise ValueError(f"Colonnes manquantes dans {csv_path}: {missing} (en-tête: {list(header)})")
+    return renames
+
+def iter_clean_chunks(csv_path, age_stats=None, chunk_size=CHUNK_SIZE, seen_invoices=None, clean_age=True):
+    """Lit le CSV par morceaux et retourne les morceaux nettoyés
+
+    `clean_age=False` évite la passe de statistiques sur l'âge quand il n'est pas utilisé.
+    """
+    renames = resolve_columns(csv_path)
+    if clean_age:
+        age_stats = age_stats or compute_age_stats(csv_path, chunk_size)
+    seen_invoices = set() if seen_invoices is None else seen_invoices
+    dtypes = {source: CSV_DTYPES[target] for source, target in renames.items() if target in CSV_DTYPES}
+    reader = pd.read_csv(csv_path, dtype=dtypes, chunksize=chunk_size)
+    for chunk in reader:
+        yield clean_chunk(chunk.rename(columns=renames), age_stats, seen_invoices)
+
+# ----------------- CARACTÉRISTIQUES -----------------
+
+def _mode_by_customer(partials, column):
+    """Valeur la plus dépensée par client pour une colonne catégorielle"""
+    spend = partials.groupby(["customer_id", column], observed=True)["spend"].sum().reset_index()
+    spend = spend.sort_values("spend", ascending=False).drop_duplicates("customer_id")
+    return spend.set_index("customer_id")[column].astype("category")
+
+def build_feature_table(clean_chunks):
+    """Agrège les morceaux nettoyés en une ligne par client"""
+    partials = []
+    for chunk in clean_chunks:
+        # Agrégats partiels par (client, catégories): petits par rapport au morceau brut
+        keys = ["customer_id", "gender", "category", "shopping_mall", "payment_method"]
+        grouped = chunk.groupby(keys, observed=True, sort=False).agg(
+            age=("age", "max"),
+            spend=("spend", "sum"),
+            items=("quantity", "sum"),
+            invoices=("quantity", "size"),
+            first_purchase=(DATE_COLUMN, "min"),
+            last_purchase=(DATE_COLUMN, "max"),
+        )
+        partials.append(grouped.reset_index())
+    partials = pd.concat(partials, ignore_index=True)
+    for column in CATEGORICAL_COLUMNS:
+        partials[column] = partials[column].astype("category")
+
+    features = partials.groupby("customer_id", sort=True).agg(
+        age=("age", "max"),
+        total_spend=("spend", "sum"),
+        total_items=("items", "sum"),
+        invoices=("invoices", "sum"),
+        first_purchase=("first_purchase", "min"),
+        last_purchase=("last_purchase", "max"),
+    )
+    features["gender"] = _mode_by_customer(partials, "gender")
+    for column in ("category", "shopping_mall", "payment_method"):
+        features[f"top_{column}"] = _mode_by_customer(partials, column)
+
+    features["age"] = features["age"].round().astype("uint8")
+    features["total_spend"] = features["total_spend"].astype("float32")
+    features["total_items"] = features["total_items"].astype("int32")
+    features["invoices"] = features["invoices"].astype("int32")
+    return features
+
+def clean_customer_data(csv_path=INPUT_FILE, output_path=OUTPUT_FILE, chunk_size=CHUNK_SIZE):
+    """Nettoie le CSV en streaming et écrit la table de caractéristiques Parquet"""
+    resolve_columns(csv_path)
+    age_stats = compute_age_stats(csv_path, chunk_size)
+    logger.info(f"Âge: médiane {age_stats['median']:.1f}, bornes [{age_stats['lower']:.1f}, {age_stats['upper']:.1f}]")
+
+    features = build_feature_table(iter_clean_chunks(csv_path, age_stats, chunk_size))
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    features.to_parquet(output_path, compression="zstd")
+    logger.info(f"✅ {len(features)} clients écrits dans {output_path}")
+    return features
+
+def main(argv=None):
+    """Fonction principale"""
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Nettoyage des données clients en streaming")
+    parser.add_argument("--input", default=INPUT_FILE)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+    clean_customer_data(args.input, args.output, args.chunk_size)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,234 @@
+import sys
+import json
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+
+import numpy as np
+
+from .clean_customer_data import iter_clean_chunks, CHUNK_SIZE
+
+"""
+Profils de fidélité précalculés par client, pour personnaliser les réponses:
+- Job hors ligne: dépenses par centre commercial et par catégorie, points gagnés
+  (règle 1 point pour 10 DH de LOYALTY_CARD_CONTEXT), dernière visite
+- Stockage clé-valeur SQLite (une ligne JSON compacte par client, lookup par clé primaire)
+- Rafraîchissement incrémental: chaque nouveau lot de transactions est fusionné
+  dans les profils existants et n'est jamais compté deux fois (lot identifié par
+  l'empreinte de son contenu, factures déjà intégrées ignorées d'un lot à l'autre)
+"""
+
+logger = logging.getLogger(__name__)
+
+# ----------------- PARAMÈTRES -----------------
+
+PROFILE_DB = "/home/anas-nouri/chatBotAPP/datasets/loyalty_card_datasets/customer_profiles.db"
+DH_PER_POINT = 10            # 1 point pour 10 DH d'achat
+MERGE_BATCH_SIZE = 500       # Clients (ou factures) relus/écrits par requête SQL
+HASH_BLOCK_SIZE = 1 << 20    # Lecture par blocs de 1 Mo pour l'empreinte d'un lot
+
+# ----------------- AGRÉGATION -----------------
+
+def aggregate_transactions(clean_chunks):
+    """Agrège des transactions nettoyées en profils partiels {customer_id: profil}"""
+    profiles = {}
+    for chunk in clean_chunks:
+        # Points calculés par facture (arrondi inférieur), comme en caisse
+        points = np.floor(chunk["spend"].to_numpy() / DH_PER_POINT).astype(np.int64)
+        chunk = chunk.assign(points=points)
+        dates = chunk["invoice_date"].dt.strftime("%Y-%m-%d")
+        chunk = chunk.assign(visit=dates)
+
+        totals = chunk.groupby("customer_id", sort=False).agg(
+            spend=("spend", "sum"),
+            points=("points", "sum"),
+            visits=("spend", "size"),
+            last_visit=("visit", "max"),
+        )
+        by_mall = chunk.groupby(["customer_id", "shopping_mall"], observed=True, sort=False)["spend"].sum()
+        by_category = chunk.groupby(["customer_id", "category"], observed=True, sort=False)["spend"].sum()
+
+        partial = {
+            customer_id: {
+                "spend": float(spend),
+                "points": int(points),
+                "visits": int(visits),
+                "last_visit": last_visit if isinstance(last_visit, str) else None,
+                "malls": {},
+                "categories": {},
+            }
+            for customer_id, spend, points, visits, last_visit in zip(
+                totals.index,
+                totals["spend"].tolist(),
+                totals["points"].tolist(),
+                totals["visits"].tolist(),
+                totals["last_visit"].tolist(),
+            )
+        }
+        for (customer_id, mall), spend in by_mall.items():
+            partial[customer_id]["malls"][str(mall)] = float(spend)
+        for (customer_id, category), spend in by_category.items():
+            partial[customer_id]["categories"][str(category)] = float(spend)
+
+        for customer_id, profile in partial.items():
+            profiles[customer_id] = merge_profiles(profiles.get(customer_id), profile)
+    return profiles
+
+def merge_profiles(current, update):
+    """Fusionne deux profils (sommes des dépenses et points, visite la plus récente)"""
+    if current is None:
+        return update
+    merged = {
+        "spend": current["spend"] + update["spend"],
+        "points": current["points"] + update["points"],
+        "visits": current["visits"] + update["visits"],
+        "last_visit": max(filter(None, [current["last_visit"], update["last_visit"]]), default=None),
+        "malls": dict(current["malls"]),
+        "categories": dict(current["categories"]),
+    }
+    for key in ("malls", "categories"):
+        for name, spend in update[key].items():
+            merged[key][name] = merged[key].get(name, 0.0) + spend
+    return merged
+
+# ----------------- STORE -----------------
+
+class ProfileStore:
+    """Store clé-valeur SQLite des profils clients"""
+
+    def __init__(self, db_path=PROFILE_DB):
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS profiles (customer_id TEXT PRIMARY KEY, profile TEXT) WITHOUT ROWID"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS processed_batches (batch_id TEXT PRIMARY KEY, customers INTEGER)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS processed_invoices (invoice_no TEXT PRIMARY KEY) WITHOUT ROWID"
+            )
+
+    def get(self, customer_id):
+        """Retourne le profil d'un client (None si inconnu)"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT profile FROM profiles WHERE customer_id = ?", (customer_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def is_processed(self, batch_id):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT 1 FROM processed_batches WHERE batch_id = ?", (batch_id,)
+            ).fetchone() is not None
+
+    def known_invoices(self, invoice_nos):
+        """Sous-ensemble des factures déjà intégrées dans un lot précédent"""
+        invoice_nos = list(invoice_nos)
+        known = set()
+        with self.lock:
+            for start in range(0, len(invoice_nos), MERGE_BATCH_SIZE):
+                ids = invoice_nos[start:start + MERGE_BATCH_SIZE]
+                placeholders = ",".join("?" * len(ids))
+                known.update(row[0] for row in self.conn.execute(
+                    f"SELECT invoice_no FROM processed_invoices WHERE invoice_no IN ({placeholders})", ids
+                ))
+        return known
+
+    def merge(self, profiles, batch_id, invoice_nos=()):
+        """Fusionne des profils partiels et enregistre le lot et ses factures dans la même transaction"""
+        customer_ids = list(profiles)
+        with self.lock, self.conn:
+            for start in range(0, len(customer_ids), MERGE_BATCH_SIZE):
+                ids = customer_ids[start:start + MERGE_BATCH_SIZE]
+                placeholders = ",".join("?" * len(ids))
+                existing = dict(self.conn.execute(
+                    f"SELECT customer_id, profile FROM profiles WHERE customer_id IN ({placeholders})", ids
+                ).fetchall())
+                rows = []
+                for customer_id in ids:
+                    current = json.loads(existing[customer_id]) if customer_id in existing else None
+                    merged = merge_profiles(current, profiles[customer_id])
+                    rows.append((customer_id, json.dumps(merged, ensure_ascii=False, separators=(",", ":"))))
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO profiles (customer_id, profile) VALUES (?, ?)", rows
+                )
+            self.conn.execute(
+                "INSERT INTO processed_batches (batch_id, customers) VALUES (?, ?)",
+                (batch_id, len(customer_ids))
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO processed_invoices (invoice_no) VALUES (?)",
+                ((invoice_no,) for invoice_no in invoice_nos)
+            )
+
+# ----------------- JOB HORS LIGNE -----------------
+
+def batch_id_for(csv_path):
+    """Identifiant d'un lot: empreinte sha256 du contenu (indépendante du nom et de la date)"""
+    digest = hashlib.sha256()
+    with open(csv_path, "rb") as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return f"sha256:{digest.hexdigest()}"
+
+def iter_new_transactions(csv_path, store, chunk_size=CHUNK_SIZE, new_invoices=None):
+    """Morceaux nettoyés sans les factures déjà intégrées; collecte les nouvelles dans `new_invoices`"""
+    for chunk in iter_clean_chunks(csv_path, chunk_size=chunk_size, clean_age=False):
+        known = store.known_invoices(chunk["invoice_no"].dropna().tolist())
+        if known:
+            chunk = chunk.loc[~chunk["invoice_no"].isin(known)]
+        if new_invoices is not None:
+            new_invoices.extend(chunk["invoice_no"].dropna().tolist())
+        yield chunk
+
+def refresh_profiles(csv_paths, store, chunk_size=CHUNK_SIZE):
+    """Intègre de nouveaux lots de transactions dans le store (lots et factures déjà vus ignorés)"""
+    for csv_path in csv_paths:
+        batch_id = batch_id_for(csv_path)
+        if store.is_processed(batch_id):
+            logger.info(f"⏭️ Lot déjà intégré: {csv_path}")
+            continue
+        new_invoices = []
+        profiles = aggregate_transactions(iter_new_transactions(csv_path, store, chunk_size, new_invoices))
+        store.merge(profiles, batch_id, new_invoices)
+        logger.info(f"✅ {len(profiles)} profils mis à jour depuis {csv_path} ({len(new_invoices)} nouvelles factures)")
+
+# ----------------- PERSONNALISATION -----------------
+
+def format_profile_context(profile, top=2):
+    """Résumé court du profil à injecter dans le prompt du chatbot"""
+    if not profile:
+        return ""
+    malls = sorted(profile["malls"].items(), key=lambda item: -item[1])[:top]
+    categories = sorted(profile["categories"].items(), key=lambda item: -item[1])[:top]
+    lines = [
+        "Profil du client:",
+        f"- Points cumulés: {profile['points']} (1 point pour {DH_PER_POINT} DH)",
+        f"- Dépenses totales: {profile['spend']:.2f} DH sur {profile['visits']} achats",
+    ]
+    if profile.get("last_visit"):
+        lines.append(f"- Dernière visite: {profile['last_visit']}")
+    if malls:
+        lines.append("- Magasins préférés: " + ", ".join(name for name, _ in malls))
+    if categories:
+        lines.append("- Catégories préférées: " + ", ".join(name for name, _ in categories))
+    return "\n".join(lines)
+
+def main(argv=None):
+    """Fonction principale"""
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Calcul incrémental des profils de fidélité")
+    parser.add_argument("csv_files", nargs="+", help="Lots de transactions (CSV)")
+    parser.add_argument("--db", default=PROFILE_DB)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+    refresh_profiles(args.csv_files, ProfileStore(args.db), chunk_size=args.chunk_size)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,7 @@
+"""
+Génération du dataset FAQ carte de fidélité.
+
+Les modules de ce package n'importent aucun SDK au chargement: les clients
+(Groq, serveur local, passerelle) sont construits à la première requête.
+Point d'entrée en ligne de commande: python -m GnerateData --help
+"""
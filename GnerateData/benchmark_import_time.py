@@ -0,0 +1,58 @@
+import sys
+import argparse
+import statistics
+import subprocess
+
+"""
+Benchmark du temps d'import des modules du chatbot.
+Chaque mesure se fait dans un nouveau processus Python (cache d'import froid côté modules)
+et vérifie qu'aucun SDK lourd n'est chargé par un simple import.
+"""
+
+MODULES = [
+    "GnerateData.generate_chat_datasets",
+    "GnerateData.prompt_bandit",
+    "GnerateData.convert_to_training_format",
+    "ApiTest.API_Test",
+    "ApiTest.rag_prompt_builder",
+    "ApiTest.session_store",
+    "ApiTest.llm_gateway",
+]
+HEAVY_MODULES = ["groq", "openai", "tenacity", "tqdm", "dotenv", "numpy", "pyarrow", "httpx"]
+RUNS = 5
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = sorted(name for name in {heavy!r} if name in sys.modules)
+print(elapsed, ",".join(heavy))
+"""
+
+def measure(module, runs=RUNS):
+    """Retourne (temps médian en ms, SDK lourds chargés)"""
+    timings, heavy = [], ""
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            capture_output=True, text=True, check=True
+        ).stdout.split()
+        timings.append(float(output[0]) * 1000)
+        heavy = output[1] if len(output) > 1 else ""
+    return statistics.median(timings), heavy
+
+def main(argv=None):
+    """Fonction principale"""
+    parser = argparse.ArgumentParser(description="Temps d'import des modules")
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--runs", type=int, default=RUNS)
+    args = parser.parse_args(argv)
+
+    print(f"{'module':45} {'import (ms)':>12}  SDK chargés")
+    for module in args.modules:
+        median_ms, heavy = measure(module, args.runs)
+        print(f"{module:45} {median_ms:12.1f}  {heavy or '-'}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,96 @@
+import sys
+import argparse
+
+"""
+Point d'entrée en ligne de commande: python -m GnerateData <commande>
+Chaque commande n'importe son module (et ses SDK) qu'au moment de son exécution.
+"""
+
+def _generate(args):
+    from . import generate_chat_datasets
+    if args.backend:
+        generate_chat_datasets.GENERATION_BACKEND = args.backend
+    if args.count:
+        generate_chat_datasets.QUESTIONS_PER_CATEGORY = args.count
+    if args.max_tokens:
+        generate_chat_datasets.RUN_TOKEN_BUDGET = args.max_tokens
+    if args.max_calls:
+        generate_chat_datasets.RUN_CALL_BUDGET = args.max_calls
+    generate_chat_datasets.main()
+
+def _convert(args):
+    from .convert_to_training_format import convert_to_training_format
+    convert_to_training_format(args.input_dir, export_shards=args.shards, tokenizer_name=args.tokenizer)
+
+def _dedupe(argv):
+    from . import fingerprint_store
+    fingerprint_store.main(argv)
+
+def _export_shards(argv):
+    from . import export_training_shards
+    export_training_shards.main(argv)
+
+def _bench_imports(argv):
+    from . import benchmark_import_time
+    benchmark_import_time.main(argv)
+
+def _usage(argv):
+    from . import usage_ledger
+    usage_ledger.main(argv)
+
+def _ingest(argv):
+    from VectorStore import ingest_documents
+    ingest_documents.main(argv)
+
+def _evaluate(argv):
+    from ApiTest import evaluate_faq
+    evaluate_faq.main(argv)
+
+# Commandes dont les arguments sont transmis tels quels au module
+PASSTHROUGH_COMMANDS = {
+    "dedupe": (_dedupe, "Dédupliquer un JSONL (empreintes MinHash)"),
+    "export-shards": (_export_shards, "Exporter le dataset en shards Arrow/Parquet"),
+    "bench-imports": (_bench_imports, "Mesurer le temps d'import des modules"),
+    "usage": (_usage, "Résumé des tokens consommés par catégorie et variante de prompt"),
+    "ingest": (_ingest, "Ingérer des documents ou les paires FAQ (--faq) dans la base vectorielle"),
+    "evaluate": (_evaluate, "Évaluer la qualité et la latence des réponses FAQ"),
+}
+
+def _chat(args):
+    from ApiTest.API_Test import main as chat_main
+    chat_main()
+
+def main(argv=None):
+    """Fonction principale"""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in PASSTHROUGH_COMMANDS:
+        PASSTHROUGH_COMMANDS[argv[0]][0](argv[1:])
+        return
+
+    parser = argparse.ArgumentParser(prog="python -m GnerateData", description="Outils du chatbot FAQ carte de fidélité")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="Générer le dataset Q&A")
+    generate.add_argument("--backend", choices=["groq", "local"])
+    generate.add_argument("--count", type=int, help="Questions par catégorie")
+    generate.add_argument("--max-tokens", type=int, help="Budget de tokens de l'exécution")
+    generate.add_argument("--max-calls", type=int, help="Budget d'appels LLM de l'exécution")
+    generate.set_defaults(func=_generate)
+
+    convert = commands.add_parser("convert", help="Convertir les JSONL au format d'entraînement")
+    convert.add_argument("input_dir")
+    convert.add_argument("--shards", action="store_true", help="Exporter aussi en shards Arrow/Parquet")
+    convert.add_argument("--tokenizer", help="Tokenizer Hugging Face pour pré-tokeniser les shards")
+    convert.set_defaults(func=_convert)
+
+    for name, (_, help_text) in PASSTHROUGH_COMMANDS.items():
+        commands.add_parser(name, help=help_text)
+
+    chat = commands.add_parser("chat", help="Chat en console avec le chatbot")
+    chat.set_defaults(func=_chat)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
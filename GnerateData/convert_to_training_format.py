@@ -1,7 +1,7 @@
 import json
 import os
 
-def convert_to_training_format(input_dir="/home/anas-nouri/chatBotAPP/datasets/loyalty_card_datasets"):
+def convert_to_training_format(input_dir="/home/anas-nouri/chatBotAPP/datasets/loyalty_card_datasets", export_shards=False, tokenizer_name=None):
     """Convertit tous les fichiers JSONL au format d'entraînement"""
     
     # Fichiers à traiter
@@ -64,5 +64,15 @@ def convert_to_training_format(input_dir="/home/anas-nouri/chatBotAPP/datasets/l
     
     print(f"✅ {len(training_format)} conversations converties dans {output_file}")
 
+    # Shards Arrow/Parquet (catégorie en colonne, input_ids si tokenizer) pour les dataloaders
+    if export_shards:
+        from .export_training_shards import export_training_shards
+        export_training_shards(
+            training_format,
+            output_dir=os.path.join(input_dir, "training_shards"),
+            tokenizer_name=tokenizer_name
+        )
+
 # Utilisation
-convert_to_training_format()
\ No newline at end of file
+if __name__ == "__main__":
+    convert_to_training_format()
\ No newline at end of file
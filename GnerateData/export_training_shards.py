@@ -0,0 +1,227 @@
+import os
+import sys
+import glob
+import json
+import logging
+import argparse
+from collections import Counter
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+"""
+Export du dataset d'entraînement en shards Arrow/Parquet:
+- Lecture en streaming du dataset complet (question/answer/metadata) ou du format
+  {"conversations": [...], "metadata": {...}}
+- Shards de taille bornée, la catégorie est une colonne (encodage dictionnaire)
+- Pré-tokenisation optionnelle (input_ids) avec regroupement par tranche de longueur
+- Manifeste JSON avec les statistiques de chaque shard
+Les shards Arrow (format IPC) peuvent être mappés en mémoire directement par les dataloaders.
+"""
+
+logger = logging.getLogger(__name__)
+
+# ----------------- PARAMÈTRES -----------------
+
+INPUT_FILE = "loyalty_card_datasets/loyalty_card_complete_dataset.jsonl"  # Garde la catégorie de chaque paire
+OUTPUT_DIR = "loyalty_card_datasets/training_shards"
+SHARD_FORMAT = "arrow"              # "arrow" (mmap) ou "parquet" (compressé)
+MAX_ROWS_PER_SHARD = 50_000
+MAX_BYTES_PER_SHARD = 256 * 1024 * 1024
+LENGTH_BUCKETS = [128, 256, 512, 1024, 2048, 4096]  # Bornes supérieures en tokens
+TOKENIZER_NAME = None               # Ex: "meta-llama/Llama-3.1-8B-Instruct" pour pré-tokeniser
+
+MESSAGE_TYPE = pa.struct([("role", pa.string()), ("content", pa.string())])
+
+# ----------------- LECTURE -----------------
+
+def iter_training_records(file_path):
+    """Lit les conversations au format d'entraînement une par une"""
+    with open(file_path, "r", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+def to_training_record(conv):
+    """Convertit une conversation brute (question/answer) au format d'entraînement"""
+    if "conversations" in conv:
+        return conv
+    return {
+        "conversations": [
+            {"role": "user", "content": conv["question"]},
+            {"role": "assistant", "content": conv["answer"]}
+        ],
+        "metadata": conv.get("metadata", {})
+    }
+
+# ----------------- TOKENISATION -----------------
+
+def load_tokenize_fn(tokenizer_name):
+    """Retourne une fonction conversations -> input_ids (None si pas de tokenizer)"""
+    if not tokenizer_name:
+        return None
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+
+    def tokenize(conversations):
+        if getattr(tokenizer, "chat_template", None):
+            return list(tokenizer.apply_chat_template(conversations, tokenize=True))
+        text = "\n".join(f"{message['role']}: {message['content']}" for message in conversations)
+        return tokenizer.encode(text)
+
+    return tokenize
+
+def length_bucket(num_tokens, buckets=LENGTH_BUCKETS):
+    """Plus petite borne de tranche qui contient la séquence"""
+    for bound in buckets:
+        if num_tokens <= bound:
+            return bound
+    return buckets[-1] * 2
+
+# ----------------- ÉCRITURE -----------------
+
+class ShardWriter:
+    """Accumule des lignes et écrit un shard dès qu'une limite est atteinte"""
+
+    def __init__(self, output_dir, prefix, shard_format, with_tokens, manifest):
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.shard_format = shard_format
+        self.with_tokens = with_tokens
+        self.manifest = manifest
+        self.shard_index = 0
+        self._reset()
+
+    def _reset(self):
+        self.rows = {"conversations": [], "category": [], "question_hash": [], "generation_attempt": []}
+        if self.with_tokens:
+            self.rows["input_ids"] = []
+            self.rows["num_tokens"] = []
+        self.bytes = 0
+
+    def add(self, record, input_ids=None):
+        metadata = record.get("metadata") or {}
+        conversations = record["conversations"]
+        self.rows["conversations"].append(conversations)
+        self.rows["category"].append(metadata.get("category"))
+        self.rows["question_hash"].append(metadata.get("question_hash"))
+        self.rows["generation_attempt"].append(metadata.get("generation_attempt"))
+        self.bytes += sum(len(message["content"].encode("utf-8")) for message in conversations)
+        if self.with_tokens:
+            self.rows["input_ids"].append(input_ids)
+            self.rows["num_tokens"].append(len(input_ids))
+            self.bytes += 4 * len(input_ids)
+        if len(self.rows["conversations"]) >= MAX_ROWS_PER_SHARD or self.bytes >= MAX_BYTES_PER_SHARD:
+            self.flush()
+
+    def _table(self):
+        columns = {
+            "conversations": pa.array(self.rows["conversations"], type=pa.list_(MESSAGE_TYPE)),
+            "category": pa.array(self.rows["category"], type=pa.string()).dictionary_encode(),
+            "question_hash": pa.array(self.rows["question_hash"], type=pa.string()),
+            "generation_attempt": pa.array(self.rows["generation_attempt"], type=pa.int16()),
+        }
+        if self.with_tokens:
+            columns["input_ids"] = pa.array(self.rows["input_ids"], type=pa.list_(pa.int32()))
+            columns["num_tokens"] = pa.array(self.rows["num_tokens"], type=pa.int32())
+        return pa.table(columns)
+
+    def flush(self):
+        """Écrit le shard courant et l'ajoute au manifeste"""
+        n_rows = len(self.rows["conversations"])
+        if not n_rows:
+            return
+        table = self._table()
+        extension = "arrow" if self.shard_format == "arrow" else "parquet"
+        file_name = f"{self.prefix}-{self.shard_index:05d}.{extension}"
+        file_path = os.path.join(self.output_dir, file_name)
+        if self.shard_format == "arrow":
+            with pa.OSFile(file_path, "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+        else:
+            pq.write_table(table, file_path, compression="zstd")
+
+        shard_stats = {
+            "file": file_name,
+            "rows": n_rows,
+            "bytes": os.path.getsize(file_path),
+            "categories": dict(Counter(self.rows["category"])),
+        }
+        if self.with_tokens:
+            shard_stats["min_tokens"] = min(self.rows["num_tokens"])
+            shard_stats["max_tokens"] = max(self.rows["num_tokens"])
+            shard_stats["total_tokens"] = sum(self.rows["num_tokens"])
+        self.manifest["shards"].append(shard_stats)
+        logger.info(f"💾 Shard {file_name}: {n_rows} conversations")
+
+        self.shard_index += 1
+        self._reset()
+
+def clear_shards(output_dir):
+    """Supprime les shards et le manifeste d'un export précédent"""
+    stale = glob.glob(os.path.join(output_dir, "shard*.arrow")) + glob.glob(os.path.join(output_dir, "shard*.parquet"))
+    for file_path in stale + glob.glob(os.path.join(output_dir, "manifest.json")):
+        os.remove(file_path)
+    if stale:
+        logger.info(f"🧹 {len(stale)} anciens shards supprimés dans {output_dir}")
+
+def export_training_shards(records, output_dir=OUTPUT_DIR, shard_format=SHARD_FORMAT,
+                           tokenizer_name=TOKENIZER_NAME):
+    """Écrit les conversations en shards bornés et retourne le manifeste
+
+    Les shards d'un export précédent sont supprimés d'abord: le répertoire ne
+    contient que le jeu décrit par le nouveau manifeste.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    clear_shards(output_dir)
+    tokenize = load_tokenize_fn(tokenizer_name)
+    manifest = {
+        "format": shard_format,
+        "tokenizer": tokenizer_name,
+        "length_buckets": LENGTH_BUCKETS if tokenize else None,
+        "shards": [],
+    }
+
+    # Un writer par tranche de longueur: chaque shard contient des séquences de taille proche
+    writers = {}
+    for record in records:
+        record = to_training_record(record)
+        if tokenize is None:
+            key, input_ids = "shard", None
+        else:
+            input_ids = tokenize(record["conversations"])
+            key = f"shard-len{length_bucket(len(input_ids))}"
+        if key not in writers:
+            writers[key] = ShardWriter(output_dir, key, shard_format, tokenize is not None, manifest)
+        writers[key].add(record, input_ids)
+
+    for writer in writers.values():
+        writer.flush()
+
+    manifest["total_rows"] = sum(shard["rows"] for shard in manifest["shards"])
+    with open(os.path.join(output_dir, "manifest.json"), "w", encoding="utf-8") as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=2)
+
+    logger.info(f"✅ {manifest['total_rows']} conversations exportées en {len(manifest['shards'])} shards dans {output_dir}")
+    return manifest
+
+def main(argv=None):
+    """Fonction principale"""
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Export du dataset d'entraînement en shards Arrow/Parquet")
+    parser.add_argument("--input", default=INPUT_FILE)
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--format", choices=["arrow", "parquet"], default=SHARD_FORMAT)
+    parser.add_argument("--tokenizer", default=TOKENIZER_NAME)
+    args = parser.parse_args(argv)
+    return export_training_shards(
+        iter_training_records(args.input),
+        output_dir=args.output_dir,
+        shard_format=args.format,
+        tokenizer_name=args.tokenizer
+    )
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
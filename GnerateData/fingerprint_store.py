@@ -0,0 +1,322 @@
+import os
+import re
+import sys
+import json
+import time
+import itertools
+import zlib
+import logging
+import hashlib
+import argparse
+import threading
+
+import numpy as np
+
+"""
+Store persistant d'empreintes MinHash pour la déduplication des questions:
+- Signature MinHash des mots porteurs de sens de la question (mots vides et mots présents
+  dans presque toutes les questions retirés), NUM_PERM valeurs 32 bits par question
+- Recherche LSH par bandes: BANDS bandes de NUM_PERM // BANDS valeurs, puis la similarité
+  de Jaccard estimée par les signatures décide
+- Portée par catégorie (intent): deux catégories peuvent avoir des questions proches
+- Stockage compact en tableaux numpy (signatures et index trié des clés de bandes),
+  recherche en O(log n): partagé par toutes les exécutions de génération
+- Mode hors ligne: déduplication d'un JSONL existant en une seule passe
+"""
+
+logger = logging.getLogger(__name__)
+
+# ----------------- PARAMÈTRES -----------------
+
+NUM_PERM = 128
+BANDS = 32                      # 32 bandes de 4 valeurs: candidat avec une probabilité de
+                                # 0,87 à J = 0,5, 0,985 à J = 0,6 et 0,05 à J = 0,2
+# Calibré sur des paraphrases des exemples de CATEGORY_CONTEXTS (mots porteurs de sens):
+# paraphrases à J >= 0,5 (sauf synonymes: "coûte"/"prix"), questions distinctes à J <= 0,33
+JACCARD_THRESHOLD = 0.5
+FINGERPRINT_FILE = "loyalty_card_datasets/question_minhash_scoped.bin"
+INITIAL_CAPACITY = 1024
+REINDEX_FRACTION = 16           # Index trié reconstruit quand les ajouts récents dépassent 1/16 du store
+MIN_RECENT = 256
+
+STOP_WORDS = frozenset("""
+a à ai au aux avec avez avoir c ça ce cela ces cet cette combien comment d dans de des dois doit
+donc du elle elles en est et être existe faire faut il ils j je l la le les leur leurs lui m ma
+me mes mon n ne nos notre nous on ou où par pas peut peuvent peux pour pourquoi puis puis-je qu
+quand que quel quelle quelles quels qui quoi s sa se ses si son sont sur t ta te tes ton tous
+tout toute toutes tu un une vos votre vous y
+""".split())
+DOMAIN_WORDS = frozenset(["carte", "cartes", "fidélité", "fidelite"])  # Présents dans presque toutes les questions
+
+# Permutations par hachage multiply-shift: ((a * h + b) mod 2^64) >> 32, a impair
+_rng = np.random.default_rng(1)
+_PERM_A = _rng.integers(0, 1 << 63, NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_PERM_B = _rng.integers(0, 1 << 63, NUM_PERM, dtype=np.uint64)
+# Multiplicateurs impairs pour combiner (portée, bande, valeurs de la bande) en une clé 64 bits
+_KEY_MULT = _rng.integers(0, 1 << 63, NUM_PERM + 2, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+
+# ----------------- MINHASH -----------------
+
+def _features(text):
+    """Mots distincts porteurs de sens (tous les mots si la question n'a que des mots vides)"""
+    words = set(re.findall(r"\w+", text.lower()))
+    return (words - STOP_WORDS - DOMAIN_WORDS) or words
+
+def minhash(text):
+    """Calcule la signature MinHash d'un texte (permutations vectorisées)"""
+    features = _features(text)
+    if not features:
+        return np.full(NUM_PERM, 0xFFFFFFFF, dtype=np.uint32)
+    hashes = np.frombuffer(
+        b"".join(hashlib.blake2b(feature.encode(), digest_size=4).digest() for feature in features),
+        dtype="<u4"
+    ).astype(np.uint64)
+    permuted = (hashes[:, None] * _PERM_A + _PERM_B) >> np.uint64(32)  # Débordement voulu (mod 2^64)
+    return permuted.min(axis=0).astype(np.uint32)
+
+def jaccard_estimate(a, b):
+    """Similarité de Jaccard estimée à partir de deux signatures"""
+    return float(np.mean(a == b))
+
+def scope_id(scope):
+    """Identifiant 32 bits d'une portée (catégorie); None et "" partagent la portée 0"""
+    return zlib.crc32((scope or "").encode())
+
+def band_keys(signatures, scopes, bands=BANDS):
+    """Clés 64 bits (portée, bande, valeurs) de chaque bande: matrice (n, bands)"""
+    rows = NUM_PERM // bands
+    values = signatures[:, :rows * bands].astype(np.uint64).reshape(len(signatures), bands, rows)
+    keys = (values * _KEY_MULT[:rows]).sum(axis=2)  # Débordement voulu (mod 2^64)
+    keys += np.arange(bands, dtype=np.uint64) * _KEY_MULT[-2]
+    keys += np.asarray(scopes, dtype=np.uint64)[:, None] * _KEY_MULT[-1]
+    return keys
+
+# ----------------- STORE -----------------
+
+class FingerprintStore:
+    """Table de signatures MinHash sur disque avec index LSH par bandes en mémoire
+
+    Les clés de bandes sont gardées dans un tableau trié (recherche dichotomique);
+    les ajouts récents passent par un petit dictionnaire, fusionné dans l'index trié
+    quand il dépasse 1/REINDEX_FRACTION du store (coût amorti en O(log n) par ajout).
+    """
+
+    def __init__(self, path=FINGERPRINT_FILE, threshold=JACCARD_THRESHOLD, bands=BANDS):
+        self.path = path
+        self.threshold = threshold
+        self.bands = bands
+        self.count = 0
+        self.signatures = np.empty((INITIAL_CAPACITY, NUM_PERM), dtype=np.uint32)
+        self.scopes = np.empty(INITIAL_CAPACITY, dtype=np.uint32)
+        self._sorted_keys = np.empty(0, dtype=np.uint64)
+        self._sorted_rows = np.empty(0, dtype=np.uint32)
+        self._indexed = 0
+        self._recent = {}       # clé de bande -> lignes ajoutées depuis la dernière indexation
+        self._unsaved = 0
+        self.comparisons = 0    # Signatures comparées (suivi de la charge des recherches)
+        self.lock = threading.Lock()
+
+        if path and os.path.exists(path):
+            stored = np.fromfile(path, dtype="<u4").reshape(-1, NUM_PERM + 1)
+            self._reserve(len(stored))
+            self.scopes[:len(stored)] = stored[:, 0]
+            self.signatures[:len(stored)] = stored[:, 1:]
+            self.count = len(stored)
+            self._reindex()
+            logger.info(f"🔎 {self.count} empreintes chargées depuis {path}")
+
+    def __len__(self):
+        return self.count
+
+    def _reserve(self, size):
+        """Agrandit les tableaux (doublement) pour contenir `size` lignes"""
+        capacity = len(self.signatures)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        signatures = np.empty((capacity, NUM_PERM), dtype=np.uint32)
+        signatures[:self.count] = self.signatures[:self.count]
+        scopes = np.empty(capacity, dtype=np.uint32)
+        scopes[:self.count] = self.scopes[:self.count]
+        self.signatures, self.scopes = signatures, scopes
+
+    def _reindex(self):
+        """Fusionne les lignes ajoutées depuis la dernière indexation dans l'index trié"""
+        start = self._indexed
+        keys = band_keys(self.signatures[start:self.count], self.scopes[start:self.count], self.bands).ravel()
+        rows = np.repeat(np.arange(start, self.count, dtype=np.uint32), self.bands)
+        keys = np.concatenate([self._sorted_keys, keys])
+        rows = np.concatenate([self._sorted_rows, rows])
+        # Tri stable (timsort): la partie déjà triée est fusionnée en temps linéaire
+        order = np.argsort(keys, kind="stable")
+        self._sorted_keys = keys[order]
+        self._sorted_rows = rows[order]
+        self._indexed = self.count
+        self._recent = {}
+
+    def _find(self, signature, scope):
+        keys = band_keys(signature[None, :], [scope], self.bands)[0]
+        lows = np.searchsorted(self._sorted_keys, keys, side="left")
+        highs = np.searchsorted(self._sorted_keys, keys, side="right")
+        rows = [self._sorted_rows[low:high] for low, high in zip(lows, highs) if high > low]
+        recent = [self._recent[key] for key in keys.tolist() if key in self._recent]
+        if recent:
+            rows.append(np.fromiter((row for bucket in recent for row in bucket), dtype=np.uint32))
+        if not rows:
+            return False
+        candidates = np.unique(np.concatenate(rows))
+        candidates = candidates[self.scopes[candidates] == scope]  # Collisions de clés entre portées
+        self.comparisons += len(candidates)
+        similarities = (self.signatures[candidates] == signature).mean(axis=1)
+        return bool((similarities >= self.threshold).any())
+
+    def _index(self, signature, scope):
+        self._reserve(self.count + 1)
+        row = self.count
+        self.signatures[row] = signature
+        self.scopes[row] = scope
+        self.count += 1
+        for key in band_keys(signature[None, :], [scope], self.bands)[0].tolist():
+            self._recent.setdefault(key, []).append(row)
+        if self.count - self._indexed >= max(MIN_RECENT, self._indexed // REINDEX_FRACTION):
+            self._reindex()
+
+    def contains(self, text, scope=None):
+        """Vrai si une question quasi identique est déjà dans le store (même portée)"""
+        signature = minhash(text)
+        with self.lock:
+            return self._find(signature, scope_id(scope))
+
+    def add_if_new(self, text, scope=None):
+        """Ajoute la question si elle est nouvelle; retourne False si c'est un quasi-doublon
+
+        Vérification et ajout sont atomiques: entre threads, un seul quasi-doublon gagne.
+        `scope` (catégorie) limite la comparaison aux questions de la même portée.
+        """
+        signature = minhash(text)
+        scope = scope_id(scope)
+        with self.lock:
+            if self._find(signature, scope):
+                return False
+            self._index(signature, scope)
+            self._unsaved += 1
+            return True
+
+    def flush(self):
+        """Ajoute les nouvelles empreintes à la fin du fichier (portée puis signature par ligne)"""
+        with self.lock:
+            if not self.path or not self._unsaved:
+                return
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            start = self.count - self._unsaved
+            rows = np.column_stack([self.scopes[start:self.count], self.signatures[start:self.count]])
+            with open(self.path, "ab") as file:
+                rows.astype("<u4").tofile(file)
+            self._unsaved = 0
+
+# ----------------- MODE HORS LIGNE -----------------
+
+def extract_question(record):
+    """Retourne la question d'une ligne JSONL (format brut ou format d'entraînement)"""
+    if "question" in record:
+        return record["question"]
+    for message in record.get("conversations", []):
+        if message.get("role") == "user":
+            return message.get("content", "")
+    return ""
+
+def extract_scope(record):
+    """Retourne la catégorie d'une ligne JSONL (None pour le format d'entraînement sans métadonnées)"""
+    return record.get("intent") or (record.get("metadata") or {}).get("category")
+
+def dedupe_jsonl(input_path, output_path, store=None):
+    """Déduplique un fichier JSONL en une seule passe en streaming (par catégorie si présente)"""
+    store = store if store is not None else FingerprintStore(path=None)
+    kept = duplicates = 0
+    with open(input_path, "r", encoding="utf-8") as source, \
+         open(output_path, "w", encoding="utf-8") as target:
+        for line in source:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if store.add_if_new(extract_question(record), extract_scope(record)):
+                target.write(line if line.endswith("\n") else line + "\n")
+                kept += 1
+            else:
+                duplicates += 1
+    store.flush()
+    logger.info(f"✅ {kept} lignes gardées, {duplicates} quasi-doublons supprimés -> {output_path}")
+    return kept, duplicates
+
+# ----------------- CONTRÔLE DE MONTÉE EN CHARGE -----------------
+
+FREQUENT_WORDS = ["points", "solde", "achat", "compte", "magasin", "remise", "cadeau", "inscription"]
+
+def synthetic_questions(seed=0):
+    """Flux infini de questions synthétiques proches de la FAQ
+
+    Mots vides et mots du domaine partagés par toutes les questions, un mot fréquent
+    sur deux questions, et des mots porteurs de sens tirés d'un vocabulaire qui grandit
+    avec le flux (loi de Heaps): le nombre de vrais voisins d'une question reste borné.
+    """
+    rng = np.random.default_rng(seed)
+    stop_words = sorted(STOP_WORDS)
+    for index in itertools.count(1):
+        content = [f"mot{word}" for word in rng.integers(0, 5 * index, rng.integers(3, 6))]
+        if rng.random() < 0.5:
+            content.append(FREQUENT_WORDS[rng.integers(len(FREQUENT_WORDS))])
+        filler = rng.choice(stop_words, rng.integers(2, 5)).tolist()
+        yield " ".join(["comment", *filler, *content, "ma", "carte", "de", "fidélité"]) + " ?"
+
+def scaling_check(sizes=(1_000, 2_000, 4_000, 8_000, 16_000, 32_000), probes=500, store=None):
+    """Mesure signatures comparées et temps par ajout à plusieurs tailles de store
+
+    Le store est rempli jusqu'à chaque taille, puis `probes` ajouts sont mesurés.
+    Les recherches sont sous-linéaires si les comparaisons par ajout restent à peu
+    près constantes quand la taille double (elles sont bornées par le nombre de
+    vrais voisins, et non par la taille du store).
+    """
+    store = store if store is not None else FingerprintStore(path=None)
+    questions = synthetic_questions()
+    results = []
+    for size in sizes:
+        while len(store) < size:
+            store.add_if_new(next(questions))
+        comparisons = store.comparisons
+        start = time.perf_counter()
+        for _ in range(probes):
+            store.add_if_new(next(questions))
+        elapsed = time.perf_counter() - start
+        results.append({
+            "size": size,
+            "comparisons_per_insert": (store.comparisons - comparisons) / probes,
+            "us_per_insert": 1e6 * elapsed / probes,
+        })
+    return results
+
+def main(argv=None):
+    """Fonction principale (déduplication hors ligne)"""
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Déduplication MinHash d'un fichier JSONL")
+    parser.add_argument("input", nargs="?")
+    parser.add_argument("output", nargs="?")
+    parser.add_argument("--store", default=None,
+                        help="Fichier d'empreintes partagé (ex: %s)" % FINGERPRINT_FILE)
+    parser.add_argument("--bench", action="store_true",
+                        help="Contrôle de montée en charge des recherches (comparaisons par ajout)")
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        print(f"{'taille':>8} {'comparaisons/ajout':>19} {'µs/ajout':>9}")
+        for row in scaling_check():
+            print(f"{row['size']:8d} {row['comparisons_per_insert']:19.1f} {row['us_per_insert']:9.0f}")
+        return
+    if not args.input or not args.output:
+        parser.error("input et output sont requis (sauf avec --bench)")
+    dedupe_jsonl(args.input, args.output, FingerprintStore(path=args.store))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
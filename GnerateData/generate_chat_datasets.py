@@ -1,27 +1,29 @@
 import os
-from dotenv import load_dotenv
-from tenacity import retry, stop_after_attempt, wait_exponential
 import logging
 import json
-from tqdm import tqdm
-from groq import Groq
 import random
 from difflib import SequenceMatcher
 import hashlib
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 """
 Script pour générer un dataset de FAQ sur les cartes de fidélité
 en utilisant deux modèles:
 - Un modèle pour générer des questions réalistes basées sur les FAQ existantes
 - Un modèle pour générer des réponses officielles basées sur les sites d'entreprises
+
+Les SDK (groq, openai, tenacity, tqdm, numpy, pyarrow) sont importés à la première
+utilisation: importer une fonction utilitaire ne coûte rien et ne demande aucune clé.
+Lancement: python -m GnerateData generate
 """
 
-# Configuration du logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Chargement des variables d'environnement
-load_dotenv("/home/anas-nouri/chatBotAPP/config/.env")
+# Fichier .env chargé à la création du premier client
+DOTENV_PATH = os.getenv("CHATBOT_ENV_FILE", "/home/anas-nouri/chatBotAPP/config/.env")
 
 # Modèles disponibles
 
@@ -34,10 +36,6 @@ MODEL_KIMI = "moonshotai/kimi-k2-instruct"    # Preview model
 MODEL_OPENAI = "qwen/qwen3-32b"
 
 
-client = Groq(
-    api_key=os.environ.get("GROQ_API_KEY"),
-)
-
 # ----------------- PARAMÈTRES -----------------
 
 # OPTIONS DE GÉNÉRATION
@@ -56,6 +54,20 @@ GENERATE_EXPIRATION = True
 QUESTION_MODEL = MODEL_LLAMA_70B   # Modèle pour générer les questions
 ANSWER_MODEL = MODEL_OPENAI      # Modèle pour générer les réponses
 
+# BACKEND DE GÉNÉRATION: "groq" (API) ou "local" (Ollama ou tout serveur compatible OpenAI)
+GENERATION_BACKEND = "groq"
+LOCAL_BASE_URL = "http://localhost:11434/v1"  # Endpoint OpenAI-compatible d'Ollama
+LOCAL_QUESTION_MODEL = "llama3"
+LOCAL_ANSWER_MODEL = "llama3"
+LOCAL_REQUEST_TIMEOUT = 600  # Les modèles sur CPU peuvent être lents
+
+# Requêtes simultanées (catégories générées en parallèle), plafond partagé par tous les appels
+# y compris les candidats en mode "parallel". Pour Ollama, aligner sur OLLAMA_NUM_PARALLEL du serveur
+CONCURRENT_REQUESTS = {
+    "groq": 1,
+    "local": 4,
+}
+
 # PARAMÈTRES DU MODÈLE
 temperature_questions = 1.4  # Plus de créativité pour les questions (augmenté)
 temperature_answers = 0.8    # Plus de cohérence pour les réponses
@@ -66,9 +78,40 @@ MAX_RETRY_FOR_UNIQUE = 5        # Nombre max de tentatives pour question unique
 ENABLE_SIMILARITY_CHECK = True   # Activer la vérification de similarité
 ENABLE_VARIATION_PROMPTS = True  # Activer les prompts de variation
 
+# ÉCHANTILLONNAGE SPÉCULATIF (plusieurs questions candidates par appel, les meilleures gardées en réserve)
+# Seulement pour un backend qui sait les servir: "n" sur le backend local (Groq refuse n>1),
+# "parallel" si CONCURRENT_REQUESTS > 1. Sinon une question par appel (voir effective_question_candidates)
+QUESTION_CANDIDATES = 1         # Candidats demandés par tentative (1 = une question par appel)
+CANDIDATE_MODE = "parallel"     # "n": un seul appel avec n>1, "parallel": k appels simultanés
+
+# SÉLECTION ADAPTATIVE DES PROMPTS (bandit sur variante x température x modèle)
+ENABLE_PROMPT_BANDIT = True
+BANDIT_QUESTION_MODELS = None  # None = [QUESTION_MODEL]; lister d'autres modèles pour les mettre en concurrence
+BANDIT_STATS_FILE = "prompt_bandit_stats.json"
+
+# DÉDUPLICATION ENTRE EXÉCUTIONS (empreintes MinHash par catégorie, paires des exécutions précédentes conservées)
+ENABLE_CROSS_RUN_DEDUPE = True
+FINGERPRINT_FILE = "loyalty_card_datasets/question_minhash_scoped.bin"
+
+# EXPORT EN SHARDS ARROW/PARQUET (en plus du JSONL d'entraînement)
+EXPORT_TRAINING_SHARDS = True
+TRAINING_TOKENIZER = None  # Nom d'un tokenizer Hugging Face pour pré-tokeniser
+
+# JOURNAL D'USAGE ET BUDGET (GnerateData/usage_ledger.py, résumé: python -m GnerateData usage)
+ENABLE_USAGE_LEDGER = True
+USAGE_LEDGER_DB = "loyalty_card_datasets/usage_ledger.db"
+RUN_TOKEN_BUDGET = None      # Arrête la génération au-delà de N tokens (prompt + complétion)
+RUN_CALL_BUDGET = None       # Arrête la génération au-delà de N appels LLM
+TOKENS_PER_MINUTE = None     # Ralentit les appels au-delà de ce débit
+
 # NOMBRE DE QUESTIONS PAR CATÉGORIE
 QUESTIONS_PER_CATEGORY = 15
 
+# PASSERELLE MULTI-FOURNISSEURS (ApiTest/llm_gateway.py)
+# Lancer depuis la racine du dépôt: python -m GnerateData generate
+USE_LLM_GATEWAY = False
+GATEWAY_FALLBACK_MODELS = ["openai/gpt-4.1-mini"]  # Modèles de secours servis par d'autres fournisseurs
+
 # ----------------- CONTEXTES ET PROMPTS -----------------
 
 # Contexte sur les cartes de fidélité au Maroc
@@ -155,8 +198,6 @@ CONTRAINTES IMPORTANTES:
 
 Questions déjà générées à éviter: {existing_questions}
 
-{loyalty_context}
-
 GÉNÈRE SEULEMENT UNE QUESTION UNIQUE ET ORIGINALE:
 """,
     """
@@ -172,8 +213,6 @@ VARIANTES À EXPLORER:
 
 Questions à éviter: {existing_questions}
 
-{loyalty_context}
-
 QUESTION ORIGINALE:
 """,
     """
@@ -189,8 +228,6 @@ PROFILS DE CLIENTS:
 
 Évite ces formulations: {existing_questions}
 
-{loyalty_context}
-
 NOUVELLE QUESTION SELON UN PROFIL:
 """
 ]
@@ -211,8 +248,6 @@ Ta réponse doit être:
 - En français
 - Complète mais concise
 
-{loyalty_context}
-
 GÉNÈRE SEULEMENT LA RÉPONSE OFFICIELLE, RIEN D'AUTRE:
 """
 
@@ -256,38 +291,244 @@ def clean_question_text(question):
     
     return question
 
-@retry(
-    stop=stop_after_attempt(5),
-    wait=wait_exponential(min=1, max=100),
-)
-def ask_groq(prompt, model, temperature=1.0):
-    """Fonction pour interroger Groq API avec gestion des erreurs"""
+# Compteurs de débit partagés entre les threads de génération
+RUN_STATS = {"calls": 0, "prompt_tokens": 0, "cached_prompt_tokens": 0, "completion_tokens": 0,
+             "rejected_questions": 0, "backlog_questions": 0}
+_stats_lock = threading.Lock()
+_thread_state = threading.local()
+
+def record_usage(usage, model=None, latency=0.0, tags=None):
+    """Ajoute l'usage d'un appel (tokens) aux compteurs, au budget et au journal d'usage
+
+    Retourne les tokens de l'appel. Appelé aussi, depuis les threads de la passerelle,
+    pour les requêtes dupliquées perdantes qui sont facturées.
+    """
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    # Tokens servis par le cache de prompt du fournisseur (préfixe système stable)
+    cached_tokens = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", 0) or 0
+    with _stats_lock:
+        RUN_STATS["calls"] += 1
+        RUN_STATS["prompt_tokens"] += prompt_tokens
+        RUN_STATS["cached_prompt_tokens"] += cached_tokens
+        RUN_STATS["completion_tokens"] += completion_tokens
+    get_budget().record(prompt_tokens + completion_tokens)
+    if ENABLE_USAGE_LEDGER:
+        get_usage_ledger().record_call(model, prompt_tokens, completion_tokens, latency, tags)
+    return prompt_tokens + completion_tokens
+
+def last_call_tokens():
+    """Tokens consommés par le dernier appel LLM du thread courant"""
+    return getattr(_thread_state, "last_call_tokens", 0)
+
+def last_call_model():
+    """Modèle qui a réellement répondu au dernier appel LLM du thread courant (bascule possible)"""
+    return getattr(_thread_state, "last_call_model", None)
+
+_request_slots = None
+
+def get_request_slots():
+    """Sémaphore partagé limitant les requêtes en vol à CONCURRENT_REQUESTS du backend"""
+    global _request_slots
+    if _request_slots is None:
+        _request_slots = threading.BoundedSemaphore(max(1, CONCURRENT_REQUESTS.get(GENERATION_BACKEND, 1)))
+    return _request_slots
+
+_budget = None
+
+def get_budget():
+    """Construit le budget de l'exécution à la première utilisation"""
+    global _budget
+    if _budget is None:
+        from .usage_ledger import TokenBudget
+        _budget = TokenBudget(RUN_TOKEN_BUDGET, RUN_CALL_BUDGET, TOKENS_PER_MINUTE)
+    return _budget
+
+def apply_generation_backend(backend=None):
+    """Applique le backend de génération (et ses modèles) avant le premier appel"""
+    global GENERATION_BACKEND, QUESTION_MODEL, ANSWER_MODEL
+    GENERATION_BACKEND = backend or GENERATION_BACKEND
+    if GENERATION_BACKEND == "local":
+        QUESTION_MODEL = LOCAL_QUESTION_MODEL
+        ANSWER_MODEL = LOCAL_ANSWER_MODEL
+
+_candidate_warnings = set()
+
+def effective_question_candidates():
+    """QUESTION_CANDIDATES si le backend peut les servir, sinon 1 (avertit une fois par raison)"""
+    if QUESTION_CANDIDATES <= 1:
+        return 1
+    reason = None
+    if CANDIDATE_MODE == "n" and GENERATION_BACKEND == "groq":
+        reason = "Groq refuse n>1"
+    elif CANDIDATE_MODE == "parallel" and CONCURRENT_REQUESTS.get(GENERATION_BACKEND, 1) <= 1:
+        reason = f"CONCURRENT_REQUESTS[{GENERATION_BACKEND!r}] = 1, les appels seraient mis en file"
+    if reason is None:
+        return QUESTION_CANDIDATES
+    if reason not in _candidate_warnings:
+        _candidate_warnings.add(reason)
+        logger.warning(f"⚠️ Mode candidats {CANDIDATE_MODE!r} ignoré ({reason}): une question par appel")
+    return 1
+
+_usage_ledger = None
+
+def get_usage_ledger():
+    """Ouvre le journal d'usage de l'exécution à la première utilisation"""
+    global _usage_ledger
+    if _usage_ledger is None:
+        from .usage_ledger import UsageLedger
+        _usage_ledger = UsageLedger(USAGE_LEDGER_DB, run_config={
+            "backend": GENERATION_BACKEND,
+            "questions_per_category": QUESTIONS_PER_CATEGORY,
+            "question_model": QUESTION_MODEL,
+            "answer_model": ANSWER_MODEL,
+            "question_candidates": effective_question_candidates(),
+            "candidate_mode": CANDIDATE_MODE,
+        })
+    return _usage_ledger
+
+_fingerprints = None
+
+def get_fingerprint_store():
+    """Charge le store d'empreintes partagé à la première utilisation"""
+    global _fingerprints
+    if _fingerprints is None:
+        from .fingerprint_store import FingerprintStore
+        _fingerprints = FingerprintStore(FINGERPRINT_FILE)
+    return _fingerprints
+
+_bandit = None
+
+def get_bandit():
+    """Construit le bandit de sélection des prompts à la première utilisation"""
+    global _bandit
+    if _bandit is None:
+        from .prompt_bandit import PromptBandit
+        _bandit = PromptBandit(
+            len(QUESTION_GENERATION_PROMPTS),
+            BANDIT_QUESTION_MODELS or [QUESTION_MODEL],  # Résolu ici, après le choix du backend
+            stats_file=BANDIT_STATS_FILE
+        )
+    return _bandit
+
+def load_env():
+    """Charge le fichier .env (clés API) avant la création d'un client"""
+    from dotenv import load_dotenv
+    load_dotenv(DOTENV_PATH)
+
+_groq_client = None
+
+def get_groq_client():
+    """Construit le client Groq à la première utilisation"""
+    global _groq_client
+    if _groq_client is None:
+        from groq import Groq
+        load_env()
+        _groq_client = Groq(
+            api_key=os.environ.get("GROQ_API_KEY"),
+        )
+    return _groq_client
+
+_local_client = None
+
+def get_local_client():
+    """Construit le client du serveur local (compatible OpenAI) à la première utilisation"""
+    global _local_client
+    if _local_client is None:
+        from openai import OpenAI
+        load_env()
+        _local_client = OpenAI(
+            base_url=LOCAL_BASE_URL,
+            api_key="ollama",  # Requis par le SDK mais ignoré par le serveur local
+            timeout=LOCAL_REQUEST_TIMEOUT,
+        )
+    return _local_client
+
+_gateway = None
+
+def get_gateway():
+    """Construit la passerelle LLM à la première utilisation"""
+    global _gateway
+    if _gateway is None:
+        from ApiTest.llm_gateway import LLMGateway
+        load_env()  # GROQ_API_KEY, GITHUB_API_KEY...
+        _gateway = LLMGateway()
+    return _gateway
+
+def ask_groq(prompt, model, temperature=1.0, system_prompt=None, tags=None):
+    """Fonction pour interroger Groq API avec gestion des erreurs (5 tentatives, attente exponentielle)
+
+    `tags` ({"category", "variant", "purpose"}) sont enregistrés avec l'appel dans le journal d'usage.
+    """
+    return ask_groq_choices(prompt, model, temperature, system_prompt, tags=tags)[0]
+
+def ask_groq_choices(prompt, model, temperature=1.0, system_prompt=None, n=1, tags=None):
+    """Comme ask_groq, mais retourne les `n` complétions d'un même appel"""
+    from tenacity import Retrying, retry_if_not_exception_type, stop_after_attempt, wait_exponential
+    from .usage_ledger import BudgetExceeded
+    
+    for attempt in Retrying(stop=stop_after_attempt(5), wait=wait_exponential(min=1, max=100),
+                            retry=retry_if_not_exception_type(BudgetExceeded), reraise=True):
+        with attempt:
+            return _ask_groq_once(prompt, model, temperature, system_prompt, n, tags)
+
+def _ask_groq_once(prompt, model, temperature, system_prompt, n=1, tags=None):
+    get_budget().acquire()  # Arrête (BudgetExceeded) ou ralentit selon le budget de l'exécution
+    messages = []
+    if system_prompt:
+        # Préfixe statique en premier pour profiter du cache de prompt du fournisseur
+        messages.append({"role": "system", "content": system_prompt})
+    messages.append({"role": "user", "content": prompt})
+    params = {"n": n} if n > 1 else {}
+    if USE_LLM_GATEWAY:
+        with get_request_slots():
+            start = time.perf_counter()
+            response = get_gateway().chat(
+                messages=messages,
+                models=[model] + GATEWAY_FALLBACK_MODELS,
+                temperature=temperature,
+                # Requêtes dupliquées perdantes: facturées, donc comptées avec les mêmes tags
+                on_extra_usage=lambda extra: record_usage(extra["usage"], extra["model"], extra["latency"], tags),
+                hedge_slots=get_request_slots(),  # La requête dupliquée prend aussi un emplacement
+                **params
+            )
+        _thread_state.last_call_model = response["model"]
+        _thread_state.last_call_tokens = record_usage(
+            response["usage"], response["model"], time.perf_counter() - start, tags
+        )
+        return [choice.strip() for choice in response["choices"]]
+    active_client = get_local_client() if GENERATION_BACKEND == "local" else get_groq_client()
     try:
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt,
-                }
-            ],
-            model=model,
-            temperature=temperature,
+        with get_request_slots():
+            start = time.perf_counter()
+            chat_completion = active_client.chat.completions.create(
+                messages=messages,
+                model=model,
+                temperature=temperature,
+                **params
+            )
+        _thread_state.last_call_model = model
+        _thread_state.last_call_tokens = record_usage(
+            getattr(chat_completion, "usage", None), model, time.perf_counter() - start, tags
         )
-        return chat_completion.choices[0].message.content.strip()
+        return [choice.message.content.strip() for choice in chat_completion.choices]
     except Exception as e:
         logger.error(f"Erreur lors de l'appel à Groq: {e}")
         raise
 
-def generate_question_for_category(category, category_info, existing_questions=None, attempt=0):
-    """Génère une question unique pour une catégorie spécifique"""
-    if existing_questions is None:
-        existing_questions = []
-    
+def build_question_prompt(category_info, existing_questions, arm=None):
+    """Prépare (prompt, température, modèle, variante) pour générer une question
+
+    `arm` = (variante, température, modèle) choisi par le bandit; sinon tirage aléatoire.
+    """
     # Choisir un prompt de variation aléatoire
-    if ENABLE_VARIATION_PROMPTS:
-        prompt_template = random.choice(QUESTION_GENERATION_PROMPTS)
+    if arm is not None:
+        variant = arm[0]
+    elif ENABLE_VARIATION_PROMPTS:
+        variant = random.randrange(len(QUESTION_GENERATION_PROMPTS))
     else:
-        prompt_template = QUESTION_GENERATION_PROMPTS[0]
+        variant = 0
+    prompt_template = QUESTION_GENERATION_PROMPTS[variant]
     
     # Limiter le nombre de questions existantes montrées pour éviter des prompts trop longs
     existing_sample = random.sample(existing_questions, min(5, len(existing_questions)))
@@ -295,72 +536,160 @@ def generate_question_for_category(category, category_info, existing_questions=N
     
     prompt = prompt_template.format(
         context=category_info["context"],
-        existing_questions=existing_text,
-        loyalty_context=LOYALTY_CARD_CONTEXT
+        existing_questions=existing_text
     )
     
     # Ajouter de la randomité avec des paramètres variables
-    temp_variation = random.uniform(1.2, 1.6)  # Température variable
+    if arm is not None:
+        temp_variation, model = arm[1], arm[2]
+    else:
+        temp_variation = random.uniform(1.2, 1.6)  # Température variable
+        model = QUESTION_MODEL
     
-    question = ask_groq(prompt, QUESTION_MODEL, temp_variation)
-    question = clean_question_text(question)
+    return prompt, temp_variation, model, variant
+
+def _ask_candidate(prompt, model, temperature, tags):
+    choices = ask_groq_choices(prompt, model, temperature, system_prompt=LOYALTY_CARD_CONTEXT, tags=tags)
+    return choices, last_call_tokens(), last_call_model()
+
+def generate_question_candidates(category, category_info, existing_questions, arm=None, k=None):
+    """Génère `k` questions candidates pour un même prompt (effective_question_candidates() par défaut)
+
+    Retourne (candidats nettoyés, tokens consommés par tous les appels, variante de prompt,
+    {candidat: modèle qui l'a réellement généré}).
+    """
+    k = k or effective_question_candidates()
+    prompt, temp_variation, model, variant = build_question_prompt(category_info, existing_questions, arm)
+    tags = {"category": category, "variant": variant, "purpose": "question"}
+    if k <= 1 or CANDIDATE_MODE == "n":
+        choices = ask_groq_choices(prompt, model, temp_variation, LOYALTY_CARD_CONTEXT, n=k, tags=tags)
+        candidates = [clean_question_text(choice) for choice in choices]
+        return candidates, last_call_tokens(), variant, dict.fromkeys(candidates, last_call_model())
     
-    return question
+    # Mode "parallel": k requêtes simultanées, les tokens sont comptés dans chaque thread
+    with ThreadPoolExecutor(max_workers=k) as executor:
+        results = list(executor.map(lambda _: _ask_candidate(prompt, model, temp_variation, tags), range(k)))
+    pairs = [(clean_question_text(choice), used_model) for choices, _, used_model in results for choice in choices]
+    candidates = [candidate for candidate, _ in pairs]
+    return candidates, sum(tokens for _, tokens, _ in results), variant, dict(pairs)
+
+def score_candidates(candidates, existing_questions, question_hashes, category=None):
+    """Classe les candidats acceptables du plus nouveau au moins nouveau
+
+    Nouveauté = 1 - similarité max avec les questions existantes. Les candidats
+    doublons (hash, similarité, empreintes) ou trop proches d'un candidat mieux
+    classé sont écartés. Retourne [(nouveauté, question)].
+    """
+    scored = []
+    for candidate in dict.fromkeys(candidates):  # Doublons exacts retirés, ordre conservé
+        if generate_question_hash(candidate) in question_hashes:
+            continue
+        similarity = 0.0
+        if ENABLE_SIMILARITY_CHECK:
+            similarity = max((calculate_similarity(candidate, q) for q in existing_questions), default=0.0)
+            if similarity > MAX_SIMILARITY_THRESHOLD:
+                continue
+        if ENABLE_CROSS_RUN_DEDUPE and get_fingerprint_store().contains(candidate, category):
+            continue
+        scored.append((1.0 - similarity, candidate))
+    scored.sort(key=lambda item: -item[0])
+    
+    kept = []
+    for novelty, candidate in scored:
+        if is_question_unique(candidate, [q for _, q in kept], MAX_SIMILARITY_THRESHOLD):
+            kept.append((novelty, candidate))
+    return kept
 
-def generate_answer_for_question(question):
+def generate_answer_for_question(question, tags=None):
     """Génère une réponse officielle pour une question"""
-    prompt = ANSWER_GENERATION_PROMPT.format(
-        question=question,
-        loyalty_context=LOYALTY_CARD_CONTEXT
-    )
+    prompt = ANSWER_GENERATION_PROMPT.format(question=question)
     
-    return ask_groq(prompt, ANSWER_MODEL, temperature_answers)
+    return ask_groq(prompt, ANSWER_MODEL, temperature_answers, system_prompt=LOYALTY_CARD_CONTEXT, tags=tags)
 
 def generate_qa_pairs_for_category(category, category_info, count=10):
     """Génère des paires question-réponse uniques pour une catégorie"""
     conversations = []
     existing_questions = []
     question_hashes = set()  # Pour vérification rapide des doublons
+    backlog = deque()        # (candidat, variante, modèle) uniques non retenus, réutilisés pour les questions suivantes
+    budget_exhausted = False
+    
+    from tqdm import tqdm
+    from .usage_ledger import BudgetExceeded
     
     logger.info(f"Génération de {count} paires Q&A UNIQUES pour la catégorie: {category}")
     
     for i in tqdm(range(count), desc=f"Génération {category}"):
         question = None
+        variant = None
+        question_model = None
         attempts = 0
         
+        # D'abord la réserve, revérifiée car d'autres questions ont pu être acceptées depuis
+        while backlog and question is None:
+            candidate, candidate_variant, candidate_model = backlog.popleft()
+            if score_candidates([candidate], existing_questions, question_hashes, category):
+                question, variant, question_model = candidate, candidate_variant, candidate_model
+                with _stats_lock:
+                    RUN_STATS["backlog_questions"] += 1
+            else:
+                with _stats_lock:
+                    RUN_STATS["rejected_questions"] += 1
+        
         # Tenter de générer une question unique
-        while attempts < MAX_RETRY_FOR_UNIQUE:
+        while question is None and attempts < MAX_RETRY_FOR_UNIQUE:
             try:
-                # Générer la question
-                question = generate_question_for_category(
-                    category, 
+                # Générer les candidats (bras choisi par le bandit si activé)
+                selection = get_bandit().select(category) if ENABLE_PROMPT_BANDIT else None
+                candidates, tokens, candidate_variant, models = generate_question_candidates(
+                    category,
                     category_info, 
                     existing_questions, 
-                    attempts
+                    arm=selection[:3] if selection else None
                 )
                 
-                # Vérifier l'unicité
-                question_hash = generate_question_hash(question)
+                # Vérifier l'unicité de tous les candidats en une fois
+                kept = score_candidates(candidates, existing_questions, question_hashes, category)
+                if selection:
+                    get_bandit().update(category, selection[3], bool(kept), tokens)
+                with _stats_lock:
+                    RUN_STATS["rejected_questions"] += len(candidates) - len(kept)
                 
-                if (question_hash not in question_hashes and 
-                    is_question_unique(question, existing_questions, MAX_SIMILARITY_THRESHOLD)):
-                    break  # Question unique trouvée
+                if kept:
+                    question, variant = kept[0][1], candidate_variant  # Le plus nouveau, les autres en réserve
+                    question_model = models.get(question)
+                    backlog.extend((candidate, candidate_variant, models.get(candidate)) for _, candidate in kept[1:])
                 else:
-                    logger.debug(f"Question similaire détectée, tentative {attempts + 1}")
+                    logger.debug(f"Questions similaires détectées, tentative {attempts + 1}")
                     attempts += 1
-                    question = None
                     
+            except BudgetExceeded as e:
+                logger.warning(f"⛔ {e}: arrêt de la génération pour {category}")
+                budget_exhausted = True
+                break
             except Exception as e:
                 logger.error(f"Erreur génération question (tentative {attempts + 1}): {e}")
                 attempts += 1
         
+        if budget_exhausted:
+            break
         if question is None:
             logger.warning(f"Impossible de générer une question unique après {MAX_RETRY_FOR_UNIQUE} tentatives")
             continue
         
         try:
             # Générer la réponse
-            answer = generate_answer_for_question(question)
+            answer = generate_answer_for_question(
+                question, tags={"category": category, "variant": variant, "purpose": "answer"}
+            )
+            answer_model = last_call_model()
+            
+            # Réserver l'empreinte dans la portée de la catégorie (vérification et ajout atomiques)
+            if ENABLE_CROSS_RUN_DEDUPE and not get_fingerprint_store().add_if_new(question, category):
+                logger.debug(f"Quasi-doublon d'une question déjà enregistrée: {question}")
+                with _stats_lock:
+                    RUN_STATS["rejected_questions"] += 1
+                continue
             
             # Ajouter à la liste des questions existantes
             existing_questions.append(question)
@@ -376,14 +705,20 @@ def generate_qa_pairs_for_category(category, category_info, count=10):
                     "question_hash": generate_question_hash(question),
                     "generation_attempt": attempts + 1,
                     "generated_by": {
-                        "question_model": QUESTION_MODEL,
-                        "answer_model": ANSWER_MODEL
+                        # Modèles qui ont réellement répondu (la passerelle peut basculer)
+                        "question_model": question_model or QUESTION_MODEL,
+                        "answer_model": answer_model or ANSWER_MODEL
                     }
                 }
             }
             
             conversations.append(conversation)
+            if ENABLE_USAGE_LEDGER:
+                get_usage_ledger().record_pair(category, variant)
             
+        except BudgetExceeded as e:
+            logger.warning(f"⛔ {e}: arrêt de la génération pour {category}")
+            break
         except Exception as e:
             logger.error(f"Erreur lors de la génération de la réponse pour {category}: {e}")
             continue
@@ -391,9 +726,26 @@ def generate_qa_pairs_for_category(category, category_info, count=10):
     # Statistiques finales
     unique_count = len(conversations)
     logger.info(f"✅ {unique_count}/{count} questions uniques générées pour {category}")
+    if backlog:
+        logger.info(f"   {len(backlog)} candidats en réserve non utilisés")
+    
+    if ENABLE_CROSS_RUN_DEDUPE:
+        get_fingerprint_store().flush()
+    
+    if ENABLE_PROMPT_BANDIT:
+        get_bandit().save()
+        for per_1k, rate, pulls, key in get_bandit().report(category)[:3]:
+            logger.info(f"   🎰 {key}: {rate:.0%} acceptées sur {pulls} appels, {per_1k:.2f} acceptées/1k tokens")
     
     return conversations
 
+def load_conversations_jsonl(file_path):
+    """Relit les conversations d'un fichier JSONL (liste vide si absent)"""
+    if not os.path.exists(file_path):
+        return []
+    with open(file_path, "r", encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
 def save_conversations_to_jsonl(conversations, output_dir, file_name):
     """Sauvegarde les conversations au format JSONL avec statistiques"""
     if not os.path.exists(output_dir):
@@ -407,7 +759,11 @@ def save_conversations_to_jsonl(conversations, output_dir, file_name):
     
     filtered_conversations = []
     for conv in conversations:
-        question_hash = generate_question_hash(conv.get("question", ""))
+        # Format brut (question) ou format d'entraînement (premier message utilisateur)
+        question = conv.get("question") or next(
+            (message["content"] for message in conv.get("conversations", []) if message.get("role") == "user"), ""
+        )
+        question_hash = generate_question_hash(question)
         if question_hash not in unique_questions:
             unique_questions.add(question_hash)
             filtered_conversations.append(conv)
@@ -440,21 +796,34 @@ def generate_complete_dataset():
         "benefits_advantages": GENERATE_BENEFITS_ADVANTAGES,
     }
     
-    for category, should_generate in categories_to_generate.items():
-        if should_generate and category in CATEGORY_CONTEXTS:
-            category_conversations = generate_qa_pairs_for_category(
-                category, 
-                CATEGORY_CONTEXTS[category], 
-                QUESTIONS_PER_CATEGORY
-            )
+    categories = [
+        category for category, should_generate in categories_to_generate.items()
+        if should_generate and category in CATEGORY_CONTEXTS
+    ]
+    
+    def generate_and_save(category):
+        new_conversations = generate_qa_pairs_for_category(
+            category,
+            CATEGORY_CONTEXTS[category],
+            QUESTIONS_PER_CATEGORY
+        )
+        # Les empreintes bloquent définitivement les questions des exécutions précédentes:
+        # leurs paires sont conservées dans le fichier de la catégorie au lieu d'être écrasées
+        file_name = f"loyalty_card_{category}.jsonl"
+        previous = load_conversations_jsonl(os.path.join(output_dir, file_name)) if ENABLE_CROSS_RUN_DEDUPE else []
+        category_conversations = previous + new_conversations
+        # Sauvegarder chaque catégorie dès qu'elle est terminée (rien de perdu si une autre échoue)
+        save_conversations_to_jsonl(category_conversations, output_dir, file_name)
+        return category_conversations, len(new_conversations)
+    
+    # Les catégories sont indépendantes: on les génère en parallèle selon le backend
+    start_time = time.perf_counter()
+    new_pairs = 0
+    workers = max(1, min(CONCURRENT_REQUESTS.get(GENERATION_BACKEND, 1), len(categories)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for category_conversations, new_count in executor.map(generate_and_save, categories):
             all_conversations.extend(category_conversations)
-            
-            # Sauvegarder chaque catégorie séparément
-            save_conversations_to_jsonl(
-                category_conversations, 
-                output_dir, 
-                f"loyalty_card_{category}.jsonl"
-            )
+            new_pairs += new_count
     
     # Sauvegarder le dataset complet
     if all_conversations:
@@ -471,7 +840,8 @@ def generate_complete_dataset():
                 "conversations": [
                     {"role": "user", "content": conv["question"]},
                     {"role": "assistant", "content": conv["answer"]}
-                ]
+                ],
+                "metadata": conv.get("metadata", {})  # Catégorie pour l'export en shards
             })
         
         save_conversations_to_jsonl(
@@ -479,19 +849,50 @@ def generate_complete_dataset():
             output_dir,
             "loyalty_card_training_format.jsonl"
         )
+        
+        if EXPORT_TRAINING_SHARDS:
+            from .export_training_shards import export_training_shards
+            export_training_shards(
+                all_conversations,
+                output_dir=os.path.join(output_dir, "training_shards"),
+                tokenizer_name=TRAINING_TOKENIZER
+            )
     
-    logger.info(f"Dataset complet généré avec {len(all_conversations)} conversations")
+    logger.info(f"Dataset complet généré avec {len(all_conversations)} conversations ({new_pairs} nouvelles)")
+    log_throughput_report(time.perf_counter() - start_time, new_pairs)
     return all_conversations
 
+def log_throughput_report(elapsed, accepted_pairs):
+    """Affiche le débit de la génération pour comparer les backends"""
+    elapsed = max(elapsed, 1e-9)
+    concurrency = CONCURRENT_REQUESTS.get(GENERATION_BACKEND, 1)
+    logger.info(f"📊 Débit ({GENERATION_BACKEND}, {concurrency} requêtes simultanées):")
+    logger.info(f"   - Appels LLM: {RUN_STATS['calls']}")
+    logger.info(f"   - Candidats rejetés comme doublons: {RUN_STATS['rejected_questions']}")
+    logger.info(f"   - Questions servies par la réserve (sans appel): {RUN_STATS['backlog_questions']}")
+    logger.info(f"   - Appels LLM par paire acceptée: {RUN_STATS['calls'] / max(accepted_pairs, 1):.2f}")
+    logger.info(f"   - Tokens prompt/complétion: {RUN_STATS['prompt_tokens']}/{RUN_STATS['completion_tokens']}")
+    logger.info(f"   - Tokens prompt servis par le cache du fournisseur: {RUN_STATS['cached_prompt_tokens']}")
+    logger.info(f"   - Tokens prompt par appel: {RUN_STATS['prompt_tokens'] / max(RUN_STATS['calls'], 1):.0f}")
+    logger.info(f"   - Tokens générés/s: {RUN_STATS['completion_tokens'] / elapsed:.1f}")
+    logger.info(f"   - Paires acceptées/heure: {accepted_pairs * 3600 / elapsed:.1f}")
+    logger.info(f"   - Durée totale: {elapsed:.1f}s")
+    if ENABLE_USAGE_LEDGER:
+        logger.info(f"   - Journal d'usage: {USAGE_LEDGER_DB} (exécution {get_usage_ledger().run_id})")
+
 def main():
     """Fonction principale"""
+    logging.basicConfig(level=logging.INFO)
+    apply_generation_backend()
     logger.info("🚀 Début de la génération du dataset FAQ carte de fidélité")
     logger.info(f"Modèle pour questions: {QUESTION_MODEL}")
     logger.info(f"Modèle pour réponses: {ANSWER_MODEL}")
+    logger.info(f"Backend de génération: {GENERATION_BACKEND}")
     logger.info("Modèles disponibles mis à jour pour 2025")
     logger.info(f"🎯 Contrôles d'unicité activés:")
     logger.info(f"   - Seuil de similarité: {MAX_SIMILARITY_THRESHOLD}")
     logger.info(f"   - Tentatives max par question: {MAX_RETRY_FOR_UNIQUE}")
+    logger.info(f"   - Candidats par tentative: {effective_question_candidates()} (mode {CANDIDATE_MODE})")
     logger.info(f"   - Température questions: {temperature_questions}")
     
     try:
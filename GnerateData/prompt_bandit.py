@@ -0,0 +1,102 @@
+import os
+import json
+import random
+import logging
+import threading
+
+"""
+Sélection adaptative des prompts de génération de questions (bandit manchot):
+- Un bras = (variante de prompt, tranche de température, modèle)
+- État séparé par catégorie
+- Échantillonnage de Thompson sur le taux d'acceptation (question unique),
+  rapporté au nombre moyen de tokens consommés par appel
+- Statistiques persistées en JSON entre les exécutions
+"""
+
+logger = logging.getLogger(__name__)
+
+# ----------------- PARAMÈTRES -----------------
+
+TEMPERATURE_BUCKETS = [(1.2, 1.33), (1.33, 1.47), (1.47, 1.6)]
+BANDIT_STATS_FILE = "prompt_bandit_stats.json"
+DEFAULT_TOKENS_PER_CALL = 500  # Estimation pour un bras jamais joué
+
+# ----------------- BANDIT -----------------
+
+def arm_key(variant, bucket, model):
+    """Clé JSON d'un bras"""
+    return f"{variant}|{bucket}|{model}"
+
+class PromptBandit:
+    """Bandit par catégorie sur (variante de prompt, tranche de température, modèle)"""
+
+    def __init__(self, n_variants, models, stats_file=BANDIT_STATS_FILE,
+                 temperature_buckets=TEMPERATURE_BUCKETS):
+        self.arms = [
+            (variant, bucket, model)
+            for variant in range(n_variants)
+            for bucket in range(len(temperature_buckets))
+            for model in models
+        ]
+        self.temperature_buckets = temperature_buckets
+        self.stats_file = stats_file
+        self.lock = threading.Lock()
+        self.stats = self._load()
+
+    def _load(self):
+        if self.stats_file and os.path.exists(self.stats_file):
+            with open(self.stats_file, "r", encoding="utf-8") as file:
+                return json.load(file)
+        return {}
+
+    def save(self):
+        """Persiste les statistiques (écriture atomique)"""
+        if not self.stats_file:
+            return
+        with self.lock:
+            tmp_path = self.stats_file + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                json.dump(self.stats, file, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.stats_file)
+
+    def _arm_stats(self, category, key):
+        category_stats = self.stats.setdefault(category, {})
+        return category_stats.setdefault(key, {"pulls": 0, "accepted": 0, "tokens": 0})
+
+    def select(self, category):
+        """Choisit un bras et retourne (variante, température, modèle)
+
+        Score = taux d'acceptation tiré d'une loi Beta / tokens moyens par appel,
+        soit le nombre attendu de questions acceptées par token dépensé.
+        """
+        with self.lock:
+            best_score, best_arm = None, None
+            for arm in self.arms:
+                stats = self._arm_stats(category, arm_key(*arm))
+                acceptance = random.betavariate(stats["accepted"] + 1, stats["pulls"] - stats["accepted"] + 1)
+                tokens = stats["tokens"] / stats["pulls"] if stats["pulls"] else DEFAULT_TOKENS_PER_CALL
+                score = acceptance / max(tokens, 1)
+                if best_score is None or score > best_score:
+                    best_score, best_arm = score, arm
+        variant, bucket, model = best_arm
+        low, high = self.temperature_buckets[bucket]
+        return variant, random.uniform(low, high), model, best_arm
+
+    def update(self, category, arm, accepted, tokens):
+        """Enregistre le résultat d'un appel (question acceptée ou non, tokens consommés)"""
+        with self.lock:
+            stats = self._arm_stats(category, arm_key(*arm))
+            stats["pulls"] += 1
+            stats["accepted"] += int(accepted)
+            stats["tokens"] += tokens
+
+    def report(self, category):
+        """Bras triés par questions acceptées pour 1000 tokens"""
+        rows = []
+        for key, stats in self.stats.get(category, {}).items():
+            if not stats["pulls"]:
+                continue
+            rate = stats["accepted"] / stats["pulls"]
+            per_1k = 1000 * stats["accepted"] / max(stats["tokens"], 1)
+            rows.append((per_1k, rate, stats["pulls"], key))
+        return sorted(rows, reverse=True)
@@ -0,0 +1,218 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+from collections import deque
+
+"""
+Journal d'usage des appels LLM et budget de la génération:
+- Chaque appel est ajouté (jamais modifié) dans une base SQLite locale:
+  tokens prompt/complétion, latence, modèle, catégorie, variante de prompt
+- Chaque paire acceptée est aussi journalisée, pour calculer les tokens par paire
+- Plafonds par exécution (tokens, appels) qui arrêtent la génération,
+  et limite de tokens par minute qui la ralentit
+- Résumé: tokens par paire acceptée par catégorie et variante de prompt
+"""
+
+logger = logging.getLogger(__name__)
+
+# ----------------- PARAMÈTRES -----------------
+
+USAGE_LEDGER_DB = "loyalty_card_datasets/usage_ledger.db"
+THROTTLE_WINDOW = 60.0       # Fenêtre glissante (secondes) de la limite de tokens par minute
+
+# ----------------- BUDGET -----------------
+
+class BudgetExceeded(Exception):
+    """Plafond de tokens ou d'appels atteint pour l'exécution"""
+
+class TokenBudget:
+    """Plafonds durs par exécution et limite de débit (tokens par minute)
+
+    Vérifié avant chaque appel: les appels déjà en vol peuvent dépasser
+    légèrement le plafond (au plus un appel par thread).
+    """
+
+    def __init__(self, max_tokens=None, max_calls=None, tokens_per_minute=None):
+        self.max_tokens = max_tokens
+        self.max_calls = max_calls
+        self.tokens_per_minute = tokens_per_minute
+        self.tokens = 0
+        self.calls = 0
+        self.window = deque()  # (instant, tokens) des appels de la dernière minute
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Lève BudgetExceeded si un plafond est atteint, attend si le débit est dépassé"""
+        while True:
+            with self.lock:
+                if self.max_tokens is not None and self.tokens >= self.max_tokens:
+                    raise BudgetExceeded(f"Budget de {self.max_tokens} tokens atteint ({self.tokens} consommés)")
+                if self.max_calls is not None and self.calls >= self.max_calls:
+                    raise BudgetExceeded(f"Budget de {self.max_calls} appels atteint")
+                if not self.tokens_per_minute:
+                    return
+                now = time.monotonic()
+                while self.window and self.window[0][0] <= now - THROTTLE_WINDOW:
+                    self.window.popleft()
+                if sum(tokens for _, tokens in self.window) < self.tokens_per_minute:
+                    return
+                wait = self.window[0][0] + THROTTLE_WINDOW - now
+            logger.debug(f"Limite de {self.tokens_per_minute} tokens/min atteinte, pause de {wait:.1f}s")
+            time.sleep(max(wait, 0.01))
+
+    def record(self, tokens):
+        with self.lock:
+            self.tokens += tokens
+            self.calls += 1
+            if self.tokens_per_minute:
+                self.window.append((time.monotonic(), tokens))
+
+# ----------------- JOURNAL -----------------
+
+class UsageLedger:
+    """Journal SQLite en ajout seul des appels LLM et des paires acceptées"""
+
+    def __init__(self, db_path=USAGE_LEDGER_DB, run_id=None, run_config=None):
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.run_id = run_id or time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}"
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS runs (run_id TEXT PRIMARY KEY, started REAL, config TEXT)")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS calls (run_id TEXT, ts REAL, category TEXT, variant INTEGER, "
+                "purpose TEXT, model TEXT, prompt_tokens INTEGER, completion_tokens INTEGER, latency REAL)"
+            )
+            self.conn.execute("CREATE TABLE IF NOT EXISTS pairs (run_id TEXT, ts REAL, category TEXT, variant INTEGER)")
+            self.conn.execute(
+                "INSERT OR IGNORE INTO runs (run_id, started, config) VALUES (?, ?, ?)",
+                (self.run_id, time.time(), json.dumps(run_config or {}, ensure_ascii=False))
+            )
+
+    def record_call(self, model, prompt_tokens, completion_tokens, latency, tags=None):
+        """Ajoute un appel; `tags` = {"category", "variant", "purpose"} (optionnels)"""
+        tags = tags or {}
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO calls VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.run_id, time.time(), tags.get("category"), tags.get("variant"), tags.get("purpose"),
+                 model, prompt_tokens, completion_tokens, latency)
+            )
+
+    def record_pair(self, category, variant=None):
+        """Ajoute une paire question-réponse acceptée"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO pairs VALUES (?, ?, ?, ?)", (self.run_id, time.time(), category, variant)
+            )
+
+# ----------------- RÉSUMÉ -----------------
+
+def latest_run_id(conn):
+    row = conn.execute("SELECT run_id FROM runs ORDER BY started DESC LIMIT 1").fetchone()
+    return row[0] if row else None
+
+def summarize_usage(db_path=USAGE_LEDGER_DB, run_id=None, all_runs=False):
+    """Tokens, appels, latence et paires acceptées par (catégorie, variante)
+
+    Les tokens des réponses sont attribués à la variante de leur question,
+    de sorte que tokens / paires donne le coût complet d'une paire acceptée.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        if not all_runs:
+            run_id = run_id or latest_run_id(conn)
+        where = "" if all_runs else "WHERE run_id = ?"
+        params = () if all_runs else (run_id,)
+        calls = conn.execute(
+            f"SELECT category, variant, COUNT(*), SUM(prompt_tokens), SUM(completion_tokens), AVG(latency) "
+            f"FROM calls {where} GROUP BY category, variant", params
+        ).fetchall()
+        pairs = dict(
+            ((category, variant), count) for category, variant, count in conn.execute(
+                f"SELECT category, variant, COUNT(*) FROM pairs {where} GROUP BY category, variant", params
+            )
+        )
+    finally:
+        conn.close()
+
+    rows = []
+    for category, variant, count, prompt_tokens, completion_tokens, latency in calls:
+        accepted = pairs.get((category, variant), 0)
+        total = (prompt_tokens or 0) + (completion_tokens or 0)
+        rows.append({
+            "category": category,
+            "variant": variant,
+            "calls": count,
+            "prompt_tokens": prompt_tokens or 0,
+            "completion_tokens": completion_tokens or 0,
+            "avg_latency": latency or 0.0,
+            "pairs": accepted,
+            "tokens_per_pair": total / accepted if accepted else None,
+        })
+    rows.sort(key=lambda row: (str(row["category"]), -1 if row["variant"] is None else row["variant"]))
+    return run_id, rows
+
+def list_runs(db_path=USAGE_LEDGER_DB):
+    """Exécutions journalisées avec leur configuration et leurs totaux"""
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(
+            "SELECT r.run_id, r.config, "
+            "(SELECT COUNT(*) FROM calls c WHERE c.run_id = r.run_id), "
+            "(SELECT COALESCE(SUM(prompt_tokens + completion_tokens), 0) FROM calls c WHERE c.run_id = r.run_id), "
+            "(SELECT COUNT(*) FROM pairs p WHERE p.run_id = r.run_id) "
+            "FROM runs r ORDER BY r.started"
+        ).fetchall()
+    finally:
+        conn.close()
+
+def print_summary(run_id, rows):
+    print(f"Exécution: {run_id or 'toutes'}")
+    print(f"{'catégorie':24} {'variante':>8} {'appels':>7} {'tok. prompt':>12} {'tok. compl.':>12} {'lat. moy.':>9} {'paires':>7} {'tok./paire':>11}")
+    totals = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "pairs": 0}
+    for row in rows:
+        per_pair = f"{row['tokens_per_pair']:.0f}" if row["tokens_per_pair"] is not None else "-"
+        variant = "-" if row["variant"] is None else str(row["variant"])
+        print(
+            f"{str(row['category'] or '-'):24} {variant:>8} {row['calls']:7d} {row['prompt_tokens']:12d} "
+            f"{row['completion_tokens']:12d} {row['avg_latency']:8.2f}s {row['pairs']:7d} {per_pair:>11}"
+        )
+        for key in totals:
+            totals[key] += row[key]
+    total_tokens = totals["prompt_tokens"] + totals["completion_tokens"]
+    per_pair = f"{total_tokens / totals['pairs']:.0f}" if totals["pairs"] else "-"
+    print(
+        f"{'TOTAL':24} {'':>8} {totals['calls']:7d} {totals['prompt_tokens']:12d} "
+        f"{totals['completion_tokens']:12d} {'':>9} {totals['pairs']:7d} {per_pair:>11}"
+    )
+
+def main(argv=None):
+    """Fonction principale"""
+    parser = argparse.ArgumentParser(description="Résumé du journal d'usage des appels LLM")
+    parser.add_argument("--db", default=USAGE_LEDGER_DB)
+    parser.add_argument("--run", help="Identifiant d'exécution (dernière exécution par défaut)")
+    parser.add_argument("--all-runs", action="store_true", help="Agréger toutes les exécutions")
+    parser.add_argument("--runs", action="store_true", help="Lister les exécutions")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        parser.error(f"Journal introuvable: {args.db}")
+    if args.runs:
+        for run_id, config, calls, tokens, pairs in list_runs(args.db):
+            per_pair = f"{tokens / pairs:.0f}" if pairs else "-"
+            print(f"{run_id}  {calls} appels  {tokens} tokens  {pairs} paires  {per_pair} tokens/paire  {config}")
+        return
+    print_summary(*summarize_usage(args.db, args.run, args.all_runs))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
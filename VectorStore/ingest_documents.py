@@ -0,0 +1,342 @@
+import os
+import sys
+import glob
+import json
+import hashlib
+import logging
+import argparse
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from tqdm import tqdm
+
+"""
+Pipeline d'ingestion en streaming pour les bases vectorielles (Chroma / FAISS):
+- Les documents sont lus un par un depuis un fichier JSONL (générateur)
+- L'encodage se fait par lots sur un pool de workers
+- Les lots encodés sont insérés (upsert) par morceaux configurables
+- Un fichier de checkpoint permet de reprendre après une interruption
+- Les paires FAQ générées (loyalty_card_*.jsonl) ont leur propre collection,
+  utilisée par le retriever du chatbot (ApiTest/API_Test.py)
+"""
+
+logger = logging.getLogger(__name__)
+
+# ----------------- PARAMÈTRES -----------------
+
+# MODÈLE D'ENCODAGE
+ENCODER_MODEL_ID = "sentence-transformers/distiluse-base-multilingual-cased-v2"
+EMBEDDING_DIM = 512
+ENCODER_DEVICE = "cpu"  # "cuda:0" si disponible
+
+# BACKEND CIBLE: "chroma" ou "faiss"
+VECTOR_BACKEND = "chroma"
+CHROMA_PATH = "./chromadb-ar-docs"
+CHROMA_COLLECTION = "ar_docs_34k"
+FAISS_DIR = "./faiss-ar-docs"
+
+# PARAMÈTRES D'INGESTION
+ENCODE_BATCH_SIZE = 256      # Documents encodés par appel à l'encodeur
+UPSERT_BATCH_SIZE = 1024     # Documents insérés par appel au backend
+ENCODE_WORKERS = 2           # Nombre de lots encodés en parallèle
+MAX_PENDING_BATCHES = 4      # Lots en vol maximum (borne la mémoire)
+CHECKPOINT_EVERY = 5         # Sauvegarde du checkpoint tous les N upserts
+
+# FICHIERS
+INPUT_FILE = "documents.jsonl"
+CHECKPOINT_FILE = "ingestion_checkpoint.json"
+
+# PAIRES FAQ CARTE DE FIDÉLITÉ (collection séparée du corpus arabe ci-dessus)
+FAQ_DATASET_DIR = "loyalty_card_datasets"
+FAQ_CHROMA_COLLECTION = "loyalty_card_faq"
+FAQ_CHECKPOINT_FILE = "faq_ingestion_checkpoint.json"
+
+# ----------------- LECTURE DES DOCUMENTS -----------------
+
+def iter_documents(file_path, text_field="text", id_field="id", metadata_field="metadata"):
+    """Lit les documents d'un fichier JSONL un par un sans tout charger en mémoire"""
+    with open(file_path, "r", encoding="utf-8") as file:
+        for line_number, line in enumerate(file):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            doc_id = record.get(id_field)
+            yield {
+                "id": str(doc_id if doc_id is not None else line_number),
+                "text": record[text_field],
+                "metadata": record.get(metadata_field) or {},
+            }
+
+def iter_faq_documents(dataset_dir=FAQ_DATASET_DIR):
+    """Lit les paires Q&A par catégorie comme passages "Question / Réponse"
+
+    L'id (catégorie + hash de la question) est stable: réingérer après une
+    nouvelle génération met à jour les paires existantes au lieu de les dupliquer.
+    """
+    for file_path in sorted(glob.glob(os.path.join(dataset_dir, "loyalty_card_*.jsonl"))):
+        name = os.path.basename(file_path)
+        if "complete_dataset" in name or "training_format" in name:
+            continue
+        with open(file_path, "r", encoding="utf-8") as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                conv = json.loads(line)
+                metadata = conv.get("metadata") or {}
+                category = conv.get("intent") or metadata.get("category", "")
+                question_hash = metadata.get("question_hash") or hashlib.md5(conv["question"].encode()).hexdigest()
+                yield {
+                    "id": f"{category}-{question_hash}",
+                    "text": f"Question: {conv['question']}\nRéponse: {conv['answer']}",
+                    "metadata": {"category": category, "source": name},
+                }
+
+def batched(iterable, size):
+    """Découpe un itérable en listes de taille `size` (la dernière peut être plus courte)"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+# ----------------- CHECKPOINT -----------------
+
+def load_checkpoint(checkpoint_path):
+    """Retourne le nombre de documents déjà ingérés (0 si aucun checkpoint)"""
+    if not os.path.exists(checkpoint_path):
+        return 0
+    with open(checkpoint_path, "r", encoding="utf-8") as file:
+        return json.load(file).get("committed", 0)
+
+def save_checkpoint(checkpoint_path, committed):
+    """Écrit le checkpoint de manière atomique"""
+    tmp_path = checkpoint_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump({"committed": committed}, file)
+    os.replace(tmp_path, checkpoint_path)
+
+# ----------------- BACKENDS -----------------
+
+class ChromaWriter:
+    """Insère les lots encodés dans une collection Chroma persistante"""
+
+    def __init__(self, path=CHROMA_PATH, collection_name=CHROMA_COLLECTION):
+        import chromadb
+
+        self.client = chromadb.PersistentClient(path=path)
+        self.collection = self.client.get_or_create_collection(
+            name=collection_name,
+            metadata={"hnsw:space": "cosine"}
+        )
+
+    def upsert(self, ids, texts, embeddings, metadatas):
+        # Chroma refuse les métadonnées vides
+        metadatas = [metadata or {"source": ""} for metadata in metadatas]
+        self.collection.upsert(
+            ids=ids,
+            documents=texts,
+            embeddings=embeddings.tolist(),
+            metadatas=metadatas
+        )
+
+    def flush(self):
+        # Le client persistant écrit déjà sur disque à chaque upsert
+        pass
+
+class FaissWriter:
+    """Insère les lots encodés dans un index FAISS (produit scalaire sur vecteurs normalisés)
+
+    FAISS n'accepte que des identifiants entiers: chaque id de document (chaîne)
+    reçoit un entier séquentiel, enregistré avec le texte dans data.jsonl.
+    """
+
+    def __init__(self, output_dir=FAISS_DIR, dim=EMBEDDING_DIM):
+        import faiss
+
+        self.faiss = faiss
+        self.output_dir = output_dir
+        self.index_path = os.path.join(output_dir, "index.faiss")
+        self.data_path = os.path.join(output_dir, "data.jsonl")
+        os.makedirs(output_dir, exist_ok=True)
+
+        if os.path.exists(self.index_path):
+            self.index = faiss.read_index(self.index_path)
+        else:
+            self.index = faiss.IndexIDMap(faiss.IndexFlatIP(dim))
+        self.id_map = self._load_id_map()
+        self._next_id = max(self.id_map.values(), default=-1) + 1
+        self._pending_records = []
+
+    def _load_id_map(self):
+        """Relit la correspondance id de document -> id FAISS depuis data.jsonl"""
+        id_map = {}
+        if os.path.exists(self.data_path):
+            with open(self.data_path, "r", encoding="utf-8") as file:
+                for line in file:
+                    if line.strip():
+                        record = json.loads(line)
+                        # Les anciens enregistrements sans faiss_id utilisaient l'id numérique
+                        id_map[record["id"]] = record["faiss_id"] if "faiss_id" in record else int(record["id"])
+        return id_map
+
+    def _faiss_id(self, doc_id):
+        if doc_id not in self.id_map:
+            self.id_map[doc_id] = self._next_id
+            self._next_id += 1
+        return self.id_map[doc_id]
+
+    def upsert(self, ids, texts, embeddings, metadatas):
+        int_ids = np.asarray([self._faiss_id(doc_id) for doc_id in ids], dtype=np.int64)
+        vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+        self.faiss.normalize_L2(vectors)
+        self.index.remove_ids(int_ids)
+        self.index.add_with_ids(vectors, int_ids)
+        self._pending_records.extend(
+            {"id": doc_id, "faiss_id": int(faiss_id), "text": text, "metadata": metadata}
+            for doc_id, faiss_id, text, metadata in zip(ids, int_ids, texts, metadatas)
+        )
+
+    def flush(self):
+        """Écrit l'index et les textes associés sur disque"""
+        self.faiss.write_index(self.index, self.index_path)
+        with open(self.data_path, "a", encoding="utf-8") as file:
+            for record in self._pending_records:
+                file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._pending_records = []
+
+def create_writer(backend=VECTOR_BACKEND, collection_name=CHROMA_COLLECTION):
+    """Construit le writer correspondant au backend choisi"""
+    if backend == "chroma":
+        return ChromaWriter(collection_name=collection_name)
+    if backend == "faiss":
+        return FaissWriter()
+    raise ValueError(f"Backend inconnu: {backend}")
+
+# ----------------- PIPELINE -----------------
+
+def load_encoder(model_id=ENCODER_MODEL_ID, device=ENCODER_DEVICE):
+    """Charge le modèle d'encodage SentenceTransformer"""
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model_id, device=device)
+
+def encode_batches(encode_fn, batches, workers=ENCODE_WORKERS, max_pending=MAX_PENDING_BATCHES):
+    """Encode les lots en parallèle et les restitue dans l'ordre d'entrée
+
+    Le nombre de lots en vol est borné pour que la mémoire reste constante
+    quelle que soit la taille du corpus.
+    """
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for batch in batches:
+            texts = [doc["text"] for doc in batch]
+            pending.append((batch, executor.submit(encode_fn, texts)))
+            if len(pending) >= max_pending:
+                done_batch, future = pending.popleft()
+                yield done_batch, future.result()
+        while pending:
+            done_batch, future = pending.popleft()
+            yield done_batch, future.result()
+
+def ingest_documents(documents, writer, encode_fn, checkpoint_path=CHECKPOINT_FILE,
+                     encode_batch_size=ENCODE_BATCH_SIZE, upsert_batch_size=UPSERT_BATCH_SIZE,
+                     total=None):
+    """Ingère un flux de documents dans le backend avec reprise sur checkpoint"""
+    committed = load_checkpoint(checkpoint_path)
+    if committed:
+        logger.info(f"🔁 Reprise de l'ingestion après {committed} documents déjà insérés")
+    documents = itertools.islice(documents, committed, None)
+
+    ids, texts, metadatas, vectors = [], [], [], []
+    upserts_since_checkpoint = 0
+
+    def commit():
+        nonlocal committed, upserts_since_checkpoint
+        writer.upsert(ids, texts, np.vstack(vectors), metadatas)
+        committed += len(ids)
+        upserts_since_checkpoint += 1
+        if upserts_since_checkpoint >= CHECKPOINT_EVERY:
+            writer.flush()
+            save_checkpoint(checkpoint_path, committed)
+            upserts_since_checkpoint = 0
+        ids.clear()
+        texts.clear()
+        metadatas.clear()
+        vectors.clear()
+
+    progress = tqdm(total=total, initial=committed, desc="Ingestion", unit="doc")
+    for batch, embeddings in encode_batches(encode_fn, batched(documents, encode_batch_size)):
+        ids.extend(doc["id"] for doc in batch)
+        texts.extend(doc["text"] for doc in batch)
+        metadatas.extend(doc["metadata"] for doc in batch)
+        vectors.append(np.asarray(embeddings, dtype=np.float32))
+        progress.update(len(batch))
+        if len(ids) >= upsert_batch_size:
+            commit()
+    if ids:
+        commit()
+    progress.close()
+
+    writer.flush()
+    save_checkpoint(checkpoint_path, committed)
+    logger.info(f"✅ {committed} documents ingérés")
+    return committed
+
+def count_lines(file_path):
+    """Compte les lignes d'un fichier (pour la barre de progression)"""
+    with open(file_path, "rb") as file:
+        return sum(1 for _ in file)
+
+def ingest_faq(dataset_dir=FAQ_DATASET_DIR, encoder=None):
+    """(Ré)ingère toutes les paires FAQ dans la collection Chroma FAQ_CHROMA_COLLECTION
+
+    Les fichiers par catégorie changent à chaque génération: le checkpoint par
+    position est remis à zéro et l'upsert par id stable rend l'opération idempotente.
+    """
+    encoder = encoder or load_encoder()
+    if os.path.exists(FAQ_CHECKPOINT_FILE):
+        os.remove(FAQ_CHECKPOINT_FILE)
+
+    def encode_fn(texts):
+        return encoder.encode(texts, batch_size=len(texts), show_progress_bar=False)
+
+    return ingest_documents(
+        iter_faq_documents(dataset_dir),
+        create_writer("chroma", FAQ_CHROMA_COLLECTION),
+        encode_fn,
+        checkpoint_path=FAQ_CHECKPOINT_FILE
+    )
+
+def main(argv=None):
+    """Fonction principale"""
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Ingestion en streaming vers Chroma / FAISS")
+    parser.add_argument("--faq", action="store_true",
+                        help=f"Ingérer les paires loyalty_card_*.jsonl dans la collection {FAQ_CHROMA_COLLECTION}")
+    parser.add_argument("--dataset-dir", default=FAQ_DATASET_DIR, help="Dossier des paires FAQ (avec --faq)")
+    args = parser.parse_args(argv)
+
+    if args.faq:
+        logger.info(f"🚀 Ingestion des paires FAQ de {args.dataset_dir} vers {FAQ_CHROMA_COLLECTION}")
+        return ingest_faq(args.dataset_dir)
+
+    logger.info(f"🚀 Ingestion de {INPUT_FILE} vers {VECTOR_BACKEND}")
+    encoder = load_encoder()
+    writer = create_writer()
+
+    def encode_fn(texts):
+        return encoder.encode(texts, batch_size=len(texts), show_progress_bar=False)
+
+    return ingest_documents(
+        iter_documents(INPUT_FILE),
+        writer,
+        encode_fn,
+        total=count_lines(INPUT_FILE)
+    )
+
+if __name__ == "__main__":
+    main(sys.argv[1:])